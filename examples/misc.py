@@ -53,8 +53,6 @@ async def serve_websocket(request):
 @bauble.websocket('/chat')
 async def chat(request, websocket):
     async for msg in websocket:
-        for ws in bauble.websockets:
-            if ws is not websocket:
-                await ws.send(msg)
+        await bauble.broadcast(msg, targets=bauble.websockets - {websocket})
 
 bauble.start()
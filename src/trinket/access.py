@@ -0,0 +1,72 @@
+from time import time, strftime, gmtime
+
+
+class AccessLog:
+    """Ring buffer of access records, written out in batches.
+
+    Recording stores the fields in preallocated columns: formatting and
+    writing happen later, off the requests. When the writer can't keep
+    up and the buffer is full, new records are dropped and counted.
+    """
+
+    __slots__ = (
+        'size', 'times', 'methods', 'paths', 'statuses', 'sizes',
+        'durations', 'head', 'count', 'dropped', 'reported')
+
+    def __init__(self, size: int=4096):
+        self.size = size
+        self.times = [0.0] * size
+        self.methods = [None] * size
+        self.paths = [None] * size
+        self.statuses = [0] * size
+        self.sizes = [0] * size
+        self.durations = [0.0] * size
+        self.head = 0
+        self.count = 0
+        self.dropped = 0
+        self.reported = 0
+
+    def __len__(self):
+        return self.count
+
+    def record(self, method: str, path: str, status: int, size: int,
+               duration: float):
+        if self.count == self.size:
+            self.dropped += 1
+            return
+        index = (self.head + self.count) % self.size
+        self.times[index] = time()
+        self.methods[index] = method
+        self.paths[index] = path
+        self.statuses[index] = status
+        self.sizes[index] = size
+        self.durations[index] = duration
+        self.count += 1
+
+    def take(self) -> list:
+        """The records so far, oldest first. The buffer is emptied.
+        """
+        records = []
+        for offset in range(self.count):
+            index = (self.head + offset) % self.size
+            records.append((
+                self.times[index], self.methods[index], self.paths[index],
+                self.statuses[index], self.sizes[index],
+                self.durations[index]))
+            # No reference kept on the request data.
+            self.paths[index] = None
+        self.head = (self.head + self.count) % self.size
+        self.count = 0
+        return records
+
+    def format(self, records: list) -> str:
+        lines = [
+            f'{strftime("%Y-%m-%dT%H:%M:%S", gmtime(timestamp))}'
+            f'.{int(timestamp % 1 * 1000):03d}Z {method} {path} '
+            f'{status} {size} {duration * 1000:.3f}ms\n'
+            for timestamp, method, path, status, size, duration in records]
+        if self.dropped > self.reported:
+            lines.append(
+                f'# {self.dropped - self.reported} records dropped\n')
+            self.reported = self.dropped
+        return ''.join(lines)
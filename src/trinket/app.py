@@ -1,4 +1,5 @@
 from functools import wraps
+from time import perf_counter
 from collections import defaultdict
 
 from curio import spawn
@@ -8,22 +9,32 @@ from trinket.handler import request_handler
 from trinket.http import HTTPStatus, HTTPError
 from trinket.lifecycle import handler_events
 from trinket.proto import Application
-from trinket.request import Request
+from trinket.request import Channel, Request
 from trinket.server import Server
-from trinket.websockets import Websocket
+from trinket.websockets import (
+    Websocket, WebsocketClosedError, Topics, frame)
+from trinket.workers import ThreadPool, ProcessPool
 
 
 class Trinket(Application, dict):
 
     __slots__ = (
-        'hooks', 'routes', 'websockets', 'server')
+        'hooks', 'routes', 'websockets', 'topics', 'broker', 'server',
+        'threads', 'processes', 'connections')
 
+    channel = Channel
     handle_request = request_handler
 
-    def __init__(self):
+    def __init__(self, threads: int=16, processes: int=None,
+                 backlog: int=None):
         self.routes = Routes()
         self.websockets = set()
+        self.connections = set()
+        self.topics = Topics()
+        self.broker = None
         self.hooks = defaultdict(list)
+        self.threads = ThreadPool(threads, backlog)
+        self.processes = ProcessPool(processes, backlog)
 
     async def lookup(self, request: Request):
         payload, params = self.routes.match(request.path)
@@ -31,6 +42,7 @@ class Trinket(Application, dict):
         if not payload:
             raise HTTPError(HTTPStatus.NOT_FOUND, request.path)
 
+        request.route = payload.get('route')
         # Uppercased in order to only consider HTTP verbs.
         handler = payload.get(request.method.upper(), None)
         if handler is None:
@@ -48,41 +60,108 @@ class Trinket(Application, dict):
     @handler_events
     async def __call__(self, request: Request):
         handler, params = await self.lookup(request)
-        return await handler(request, **params)
-
-    def route(self, path: str, methods: list=None, **extras: dict):
+        if request.timings is not None:
+            request.timings.lookup = perf_counter()
+        # The route exists: it's time to accept or refuse the body.
+        # A client expecting `100 Continue` hasn't sent it yet.
+        response = await self.notify('pre_body', request)
+        if response is not None:
+            return response
+        response = await handler(request, **params)
+        if request.timings is not None:
+            request.timings.handler = perf_counter()
+        return response
+
+    def route(self, path: str, methods: list=None, blocking: bool=False,
+              executor: str=None, **extras: dict):
         if methods is None:
             methods = ['GET']
+        if blocking and executor is None:
+            executor = 'thread'
+        if executor == 'thread':
+            pool = self.threads
+        elif executor == 'process':
+            pool = self.processes
+        elif executor is not None:
+            raise ValueError(f'Unknown executor: {executor!r}')
 
         def wrapper(func):
-            payload = {method: func for method in methods}
+            handler = func
+            if executor is not None:
+                # Synchronous handler: the body is read beforehand,
+                # the call itself happens in the worker pool.
+                @wraps(func)
+                async def handler(request, **params):
+                    await request.raw_body
+                    return await pool.run(func, request, **params)
+
+            payload = {method: handler for method in methods}
+            payload['route'] = path
             payload.update(extras)
             self.routes.add(path, **payload)
             return func
 
         return wrapper
 
-    def websocket(self, path: str, **extras: dict):
+    def websocket(self, path: str, deflate: dict=None,
+                  factory: type=Websocket, **extras: dict):
 
         def wrapper(func):
             @wraps(func)
             async def websocket_handler(request, **params):
-                websocket = Websocket(request.socket)
+                websocket = factory(request.socket, deflate)
                 try:
                     await websocket.upgrade(request)
                     self.websockets.add(websocket)
-                    task = await spawn(func, request, websocket, **params)
+                    task = await spawn(func(request, websocket, **params))
                     await websocket.flow(task)
                 finally:
                     self.websockets.discard(websocket)
+                    self.topics.discard(websocket)
 
-            payload = {'GET': websocket_handler, 'websocket': True}
+            payload = {
+                'GET': websocket_handler, 'websocket': True, 'route': path}
             payload.update(extras)
             self.routes.add(path, **payload)
             return func
 
         return wrapper
 
+    async def broadcast(self, data, targets=None) -> int:
+        """Send `data` to the `targets` websockets, all by default.
+
+        The message is framed once and the same bytes are queued for
+        every target, each writing on its own. Closed targets are
+        skipped. Returns the number of websockets reached.
+        """
+        if targets is None:
+            targets = self.websockets
+        if not targets:
+            return 0
+        message = frame(data)
+        reached = 0
+        for websocket in tuple(targets):
+            try:
+                await websocket.send_frame(message)
+            except WebsocketClosedError:
+                continue
+            reached += 1
+        return reached
+
+    async def publish(self, topic: str, data) -> int:
+        """Broadcast `data` to the subscribers of `topic`, or to every
+        websocket if `topic` is None. The broker, if any, relays it to
+        the other workers. Returns the number of local websockets reached.
+        """
+        if self.broker is not None:
+            await self.broker.publish(topic, data)
+        return await self.deliver(topic, data)
+
+    async def deliver(self, topic: str, data) -> int:
+        if topic is None:
+            return await self.broadcast(data)
+        return await self.broadcast(data, self.topics.get(topic))
+
     def listen(self, name: str):
         def wrapper(func):
             self.hooks[name].append(func)
@@ -0,0 +1,314 @@
+"""Load generator: `python -m trinket.bench hello -c 50 -n 20000`.
+
+Each scenario registers its routes on an application and returns the
+request to load it with. Unless an address is given, the application
+is served by a process of its own, so that the load is not generated
+by the kernel being measured.
+"""
+import sys
+import json
+import argparse
+import multiprocessing
+from collections import deque
+from math import ceil
+from time import perf_counter
+
+import curio
+from httptools import HttpResponseParser
+from trinket import Trinket, Response
+from trinket.server import Server
+from trinket.testing import RequestForger, Websocket
+
+
+SCENARIOS = {}
+
+# Path of the websocket scenarios: they are loaded with messages.
+WEBSOCKET = 'ws:'
+
+
+def scenario(name: str):
+    def register(setup):
+        SCENARIOS[name] = setup
+        return setup
+    return register
+
+
+@scenario('hello')
+def hello(app: Trinket) -> bytes:
+
+    @app.route('/')
+    async def hello(request):
+        return Response.raw(b'Hello, World!')
+
+    return RequestForger.forge('GET', '/', b'', headers={'Host': 'bench'})
+
+
+@scenario('json')
+def json_(app: Trinket) -> bytes:
+    value = {'items': [{'id': index, 'name': f'item {index}'}
+                       for index in range(20)]}
+
+    @app.route('/json')
+    async def items(request):
+        return Response.json(value)
+
+    return RequestForger.forge(
+        'GET', '/json', b'', headers={'Host': 'bench'})
+
+
+@scenario('upload')
+def upload(app: Trinket) -> bytes:
+
+    @app.route('/upload', methods=['POST'])
+    async def receive(request):
+        body = await request.raw_body
+        return Response.raw(str(len(body)).encode())
+
+    return RequestForger.forge(
+        'POST', '/upload', b'x' * 65536,
+        headers={'Host': 'bench', 'Content-Type': 'application/octet-stream'})
+
+
+@scenario('streaming')
+def streaming(app: Trinket) -> bytes:
+    chunk = b'x' * 4096
+
+    async def chunks():
+        for _ in range(16):
+            yield chunk
+
+    @app.route('/stream')
+    async def stream(request):
+        return Response.streamer(chunks())
+
+    return RequestForger.forge(
+        'GET', '/stream', b'', headers={'Host': 'bench'})
+
+
+@scenario('fanout')
+def fanout(app: Trinket) -> str:
+
+    @app.websocket('/fanout')
+    async def relay(request, websocket):
+        async for message in websocket:
+            await app.broadcast(message)
+
+    return WEBSOCKET + '/fanout'
+
+
+def percentile(latencies: list, quantile: float) -> float:
+    """Of sorted `latencies`: the nearest rank.
+    """
+    if not latencies:
+        return 0.0
+    return latencies[max(0, ceil(quantile * len(latencies)) - 1)]
+
+
+def report(latencies: list, duration: float, errors: int=0,
+           **details) -> dict:
+    latencies.sort()
+    return {
+        **details,
+        'requests': len(latencies),
+        'errors': errors,
+        'duration': duration,
+        'throughput': len(latencies) / duration if duration else 0.0,
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+        'p999': percentile(latencies, 0.999),
+    }
+
+
+class Exchange:
+    """Responses of a keep-alive connection, matched with the times
+    their requests were sent: HTTP/1.1 answers in order.
+    """
+
+    __slots__ = ('parser', 'sent', 'latencies', 'errors')
+
+    def __init__(self, latencies: list):
+        self.parser = HttpResponseParser(self)
+        self.sent = deque()
+        self.latencies = latencies
+        self.errors = 0
+
+    def on_message_complete(self):
+        self.latencies.append(perf_counter() - self.sent.popleft())
+        if self.parser.get_status_code() >= 400:
+            self.errors += 1
+
+
+async def connection(address: tuple, request: bytes, count: int,
+                     pipeline: int, latencies: list) -> int:
+    """Sends `count` requests, `pipeline` at most in flight, reconnecting
+    when the server closes the connection. Returns the number of errors:
+    the requests answered with an error or left unanswered.
+    """
+    exchange = Exchange(latencies)
+    while count:
+        socket = await curio.open_connection(*address)
+        # Pipelined batches are not held back waiting for an ACK.
+        socket.setsockopt(
+            curio.socket.IPPROTO_TCP, curio.socket.TCP_NODELAY, 1)
+        async with socket:
+            while count or exchange.sent:
+                batch = min(count, pipeline - len(exchange.sent))
+                if batch:
+                    now = perf_counter()
+                    exchange.sent.extend(now for _ in range(batch))
+                    await socket.sendall(request * batch)
+                    count -= batch
+                data = await socket.recv(65536)
+                if not data:
+                    exchange.errors += len(exchange.sent)
+                    exchange.sent.clear()
+                    exchange.parser = HttpResponseParser(exchange)
+                    break
+                exchange.parser.feed_data(data)
+    return exchange.errors
+
+
+async def load(address: tuple, request: bytes, connections: int=10,
+               requests: int=10000, pipeline: int=1) -> dict:
+    """Sends `requests` requests over `connections` keep-alive
+    connections, and reports the throughput and the latencies.
+    """
+    latencies = []
+    share, extra = divmod(requests, connections)
+    tasks = []
+    started = perf_counter()
+    async with curio.TaskGroup() as group:
+        for index in range(connections):
+            tasks.append(await group.spawn(
+                connection, address, request,
+                share + (index < extra), pipeline, latencies))
+    duration = perf_counter() - started
+    return report(
+        latencies, duration, sum(task.result for task in tasks),
+        connections=connections, pipeline=pipeline)
+
+
+async def listen(websocket: Websocket, messages: int, latencies: list):
+    for _ in range(messages):
+        sent = await websocket.recv()
+        latencies.append(perf_counter() - float(sent))
+
+
+async def broadcast(address: tuple, path: str, connections: int=10,
+                    messages: int=1000) -> dict:
+    """One of the `connections` websockets sends `messages` messages,
+    one at a time, each relayed to all. The latencies are those of the
+    deliveries: the time is carried by the message.
+    """
+    latencies = []
+    websockets = []
+    for _ in range(connections):
+        websocket = Websocket()
+        await websocket.connect(path, *address)
+        websockets.append((websocket, await curio.spawn(websocket.flow)))
+    sender = websockets[0][0]
+    started = perf_counter()
+    async with curio.TaskGroup() as group:
+        for websocket, _ in websockets[1:]:
+            await group.spawn(listen, websocket, messages, latencies)
+        for _ in range(messages):
+            await sender.send(repr(perf_counter()))
+            # Its own copy: the relay went through.
+            sent = await sender.recv()
+            latencies.append(perf_counter() - float(sent))
+    duration = perf_counter() - started
+    for websocket, flow in websockets:
+        try:
+            await websocket.socket.shutdown(curio.socket.SHUT_RDWR)
+        except curio.socket.error:
+            pass
+        await flow.join()
+    return report(latencies, duration, connections=connections, pipeline=1)
+
+
+def serve(setup, queue: multiprocessing.Queue):
+    app = Trinket()
+    setup(app)
+    server = Server('127.0.0.1', 0)
+
+    async def main():
+        await app.notify('startup')
+        task = await curio.spawn(server.run, app)
+        queue.put(server.sockaddr)
+        # Until terminated.
+        await task.join()
+
+    curio.run(main)
+
+
+def run(name: str, address: tuple=None, connections: int=10,
+        requests: int=10000, pipeline: int=1) -> dict:
+    """Runs the scenario `name`, against a server started for it unless
+    the `address` of one is given.
+    """
+    setup = SCENARIOS[name]
+    target = setup(Trinket())
+    process = None
+    if address is None:
+        # Not forked: the threads of the parent are left behind.
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        process = context.Process(
+            target=serve, args=(setup, queue), daemon=True)
+        process.start()
+        address = queue.get(timeout=10)
+    try:
+        if isinstance(target, str) and target.startswith(WEBSOCKET):
+            result = curio.run(
+                broadcast, address, target[len(WEBSOCKET):],
+                connections, requests)
+        else:
+            result = curio.run(
+                load, address, target, connections, requests, pipeline)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join()
+    return {'scenario': name, **result}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m trinket.bench', description=__doc__.split('\n')[0])
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help=f'Of {", ".join(SCENARIOS)}. All by default.')
+    parser.add_argument('-c', '--connections', type=int, default=10)
+    parser.add_argument('-n', '--requests', type=int, default=10000,
+                        help='Messages, for the websocket scenarios.')
+    parser.add_argument('-p', '--pipeline', type=int, default=1,
+                        help='Requests in flight per connection.')
+    parser.add_argument('-a', '--address', metavar='HOST:PORT',
+                        help='Of a server running the scenario.')
+    parser.add_argument('-o', '--output', help='JSON file of the results.')
+    arguments = parser.parse_args(argv)
+    for name in arguments.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f'unknown scenario: {name}')
+
+    address = None
+    if arguments.address:
+        host, port = arguments.address.rsplit(':', 1)
+        address = (host, int(port))
+    results = []
+    for name in arguments.scenarios or SCENARIOS:
+        result = run(name, address, arguments.connections,
+                     arguments.requests, arguments.pipeline)
+        results.append(result)
+        print(f'{name:<12}{result["throughput"]:>12,.0f} req/s'
+              f'  p50 {result["p50"] * 1000:.3f}ms'
+              f'  p99 {result["p99"] * 1000:.3f}ms'
+              f'  p999 {result["p999"] * 1000:.3f}ms'
+              f'  errors {result["errors"]}', file=sys.stderr)
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Micro-benchmarks of trinket's hot paths.
+
+Each benchmark is a setup function returning the operation to measure,
+a callable without arguments. Run them with `python -m trinket.benchmarks`.
+"""
+import gc
+import sys
+import platform
+import tracemalloc
+from time import perf_counter
+
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def synchronously(coroutine):
+    """Run a coroutine that never suspends, such as `Trinket.lookup`.
+    """
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError('The coroutine suspended.')
+
+
+def allocations(operation) -> dict:
+    """Memory allocated by one call: its peak and what it kept.
+    """
+    operation()  # Caches and lazy imports.
+    gc.collect()
+    tracemalloc.start()
+    try:
+        operation()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'peak_bytes': peak, 'retained_bytes': retained}
+
+
+def measure(operation, min_time: float=0.2, rounds: int=5) -> dict:
+    """Operations per second, the best of `rounds` timed loops each
+    lasting about `min_time` seconds.
+    """
+    number = 1
+    while True:
+        started = perf_counter()
+        for _ in range(number):
+            operation()
+        elapsed = perf_counter() - started
+        if elapsed >= min_time / rounds:
+            break
+        number *= 2
+    best = elapsed
+    for _ in range(rounds - 1):
+        started = perf_counter()
+        for _ in range(number):
+            operation()
+        best = min(best, perf_counter() - started)
+    return {'ops': number / best, 'mean_ns': best / number * 1e9}
+
+
+def selected(name: str, prefix: str) -> bool:
+    """`prefix` is the whole name or its first dotted parts.
+    """
+    return name == prefix or name.startswith(prefix + '.')
+
+
+def run(names=None, min_time: float=0.2) -> dict:
+    # Importing the suites registers their benchmarks.
+    from trinket.benchmarks import (  # noqa: F401
+        bench_http, bench_routing, bench_response, bench_websockets)
+    results = {}
+    for name, setup in sorted(BENCHMARKS.items()):
+        if names and not any(selected(name, prefix) for prefix in names):
+            continue
+        operation = setup()
+        results[name] = {**measure(operation, min_time),
+                         **allocations(operation)}
+    return {
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'benchmarks': results,
+    }
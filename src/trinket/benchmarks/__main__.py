@@ -0,0 +1,33 @@
+"""Run the micro-benchmarks and write their results as JSON.
+"""
+import sys
+import json
+import argparse
+from trinket.benchmarks import run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m trinket.benchmarks', description=__doc__)
+    parser.add_argument(
+        'names', nargs='*',
+        help='Names, or prefixes such as "channel" or "lookup.10".')
+    parser.add_argument(
+        '-o', '--output', help='JSON file for the results.')
+    parser.add_argument(
+        '-t', '--min-time', type=float, default=0.2,
+        help='Seconds spent timing each benchmark.')
+    arguments = parser.parse_args(argv)
+
+    results = run(arguments.names, arguments.min_time)
+    for name, result in results['benchmarks'].items():
+        print(f"{name:<40} {result['ops']:>12,.0f} ops/s "
+              f"{result['mean_ns']:>10,.0f} ns "
+              f"{result['peak_bytes']:>9,} B peak", file=sys.stderr)
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+from io import BytesIO
+from urllib.parse import parse_qs
+from biscuits import parse
+from trinket.http import Query
+from trinket.parsers import read_multipart, read_urlencoded
+from trinket.request import Channel
+from trinket.testing import RequestForger, encode_multipart
+from trinket.benchmarks import benchmark
+
+
+BROWSER_HEADERS = {
+    'Host': 'example.com',
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:70.0) Firefox/70.0',
+    'Accept': 'text/html,application/xhtml+xml,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+    'Cookie': 'session=0123456789abcdef; theme=dark; lang=en',
+    'Upgrade-Insecure-Requests': '1',
+    'Cache-Control': 'max-age=0',
+}
+
+
+def parsing(data: bytes, chunk: int=1024):
+    """Fed as read from the socket, `chunk` bytes at a time.
+    """
+    chunks = [data[index:index + chunk]
+              for index in range(0, len(data), chunk)]
+
+    def operation():
+        channel = Channel(None)
+        for data in chunks:
+            channel.data_received(data)
+    return operation
+
+
+@benchmark('channel.get.minimal')
+def channel_minimal():
+    return parsing(RequestForger.forge('GET', '/', b''))
+
+
+@benchmark('channel.get.browser')
+def channel_browser():
+    return parsing(RequestForger.forge(
+        'GET', '/articles/42?page=2&sort=date', b'',
+        headers=dict(BROWSER_HEADERS)))
+
+
+@benchmark('channel.post.urlencoded')
+def channel_post():
+    return parsing(RequestForger.post(
+        '/login', body={'user': 'alice', 'password': 'secret'},
+        content_type='application/x-www-form-urlencoded'))
+
+
+@benchmark('channel.post.64k')
+def channel_upload():
+    return parsing(RequestForger.forge(
+        'POST', '/upload', b'x' * 65536,
+        headers={'Content-Type': 'application/octet-stream'}))
+
+
+@benchmark('query.casting')
+def query_casting():
+    string = 'page=2&size=50&ratio=0.75&draft=false&tag=a&tag=b'
+
+    def operation():
+        query = Query(parse_qs(string, keep_blank_values=True))
+        query.int('page')
+        query.int('size')
+        query.float('ratio')
+        query.bool('draft')
+        query.list('tag')
+    return operation
+
+
+def parse_body(reader, content_type: str, body: bytes):
+    def operation():
+        parser = reader(content_type)
+        next(parser)
+        parser.send(body)
+        return parser.send(b'')
+    return operation
+
+
+@benchmark('parser.urlencoded')
+def urlencoded():
+    body = '&'.join(f'field{index}=value{index}' for index in range(20))
+    return parse_body(
+        read_urlencoded, 'application/x-www-form-urlencoded', body.encode())
+
+
+@benchmark('parser.multipart')
+def multipart():
+    body, content_type = encode_multipart({
+        'title': 'Report',
+        'comment': 'Quarterly numbers.',
+        'file': BytesIO(b'x' * 16384),
+    })
+    return parse_body(read_multipart, content_type, body)
+
+
+@benchmark('cookies.parse')
+def cookies():
+    header = BROWSER_HEADERS['Cookie'] + '; ' + '; '.join(
+        f'tracker{index}={index:032x}' for index in range(10))
+    return lambda: parse(header)
@@ -0,0 +1,35 @@
+from trinket import Response
+from trinket.benchmarks import benchmark
+
+
+def serializing(headers: int, body: int):
+    response = Response(body=b'x' * body, headers={
+        f'X-Header-{index}': f'value-{index}' for index in range(headers)})
+    return lambda: bytes(response)
+
+
+@benchmark('response.bytes.empty')
+def empty():
+    return serializing(0, 0)
+
+
+@benchmark('response.bytes.10h.1k')
+def typical():
+    return serializing(10, 1024)
+
+
+@benchmark('response.bytes.50h.1k')
+def many_headers():
+    return serializing(50, 1024)
+
+
+@benchmark('response.bytes.10h.64k')
+def large_body():
+    return serializing(10, 65536)
+
+
+@benchmark('response.json')
+def json():
+    value = {'items': [{'id': index, 'name': f'item {index}'}
+                       for index in range(20)]}
+    return lambda: bytes(Response.json(value))
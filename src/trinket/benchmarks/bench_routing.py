@@ -0,0 +1,35 @@
+from trinket import Trinket, Request, Response
+from trinket.benchmarks import benchmark, synchronously
+
+
+def routed(count: int):
+    app = Trinket()
+
+    async def handler(request, **params):
+        return Response.raw(b'')
+
+    for index in range(count):
+        app.route(f'/resource{index}/{{id}}/items')(handler)
+    request = Request(None, None)
+    request.method = 'GET'
+    # The last one registered.
+    request.path = f'/resource{count - 1}/42/items'
+
+    def operation():
+        return synchronously(app.lookup(request))
+    return operation
+
+
+@benchmark('lookup.10')
+def lookup_10():
+    return routed(10)
+
+
+@benchmark('lookup.100')
+def lookup_100():
+    return routed(100)
+
+
+@benchmark('lookup.1000')
+def lookup_1000():
+    return routed(1000)
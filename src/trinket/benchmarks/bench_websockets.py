@@ -0,0 +1,26 @@
+from wsproto.frame_protocol import FrameProtocol, Opcode, RsvBits
+from wsproto.extensions import PerMessageDeflate
+from trinket.websockets import Deflate, frame
+from trinket.benchmarks import benchmark
+
+
+@benchmark('websocket.frame.text')
+def small():
+    return lambda: frame('{"price": 101.25, "symbol": "ACME"}')
+
+
+@benchmark('websocket.frame.64k')
+def large():
+    data = b'x' * 65536
+    return lambda: frame(data)
+
+
+@benchmark('websocket.deflate.4k')
+def deflate():
+    extension = Deflate()
+    extension.accept(PerMessageDeflate().offer())
+    proto = FrameProtocol(client=False, extensions=[extension])
+    data = b'All work and no play makes Jack a dull boy. ' * 100
+    rsv = RsvBits(False, False, False)
+    return lambda: extension.frame_outbound(
+        proto, Opcode.BINARY, rsv, data, True)
@@ -0,0 +1,174 @@
+import os
+import struct
+import curio
+from abc import ABC, abstractmethod
+from time import monotonic
+from typing import Awaitable, Callable
+
+
+Deliver = Callable[[str, object], Awaitable]
+
+# kind, topic length, payload length.
+ENTRY = struct.Struct('!BHI')
+BINARY = 1
+EVERYONE = 2
+
+
+def encode(topic: str, data) -> bytes:
+    kind = 0
+    if topic is None:
+        kind |= EVERYONE
+        topic = b''
+    else:
+        topic = topic.encode()
+    if isinstance(data, str):
+        data = data.encode()
+    else:
+        kind |= BINARY
+    return ENTRY.pack(kind, len(topic), len(data)) + topic + data
+
+
+def decode(payload: bytes):
+    offset = 0
+    while offset < len(payload):
+        kind, topic_size, data_size = ENTRY.unpack_from(payload, offset)
+        offset += ENTRY.size
+        topic = payload[offset:offset + topic_size].decode()
+        offset += topic_size
+        data = payload[offset:offset + data_size]
+        offset += data_size
+        if not kind & BINARY:
+            data = data.decode()
+        yield (None if kind & EVERYONE else topic), data
+
+
+class Broker(ABC):
+    """Relays the publications of a worker to the other workers.
+
+    A `None` topic stands for every websocket of the worker.
+    """
+
+    @abstractmethod
+    async def start(self, deliver: Deliver):
+        """Start relaying. `deliver(topic, data)` is awaited for each
+        publication coming from another worker.
+        """
+
+    @abstractmethod
+    async def publish(self, topic: str, data):
+        pass
+
+    @abstractmethod
+    async def stop(self):
+        pass
+
+
+class LocalBroker(Broker):
+    """Broker between the workers of one host, over Unix datagrams.
+
+    Each worker binds a socket in `directory`, named after its pid
+    unless `name` is given. The publications of a
+    scheduling tick are batched: each batch reaches every other worker
+    once, in as few datagrams as `MAX_DATAGRAM` allows, whatever the
+    number of subscribers over there.
+    """
+
+    __slots__ = (
+        'directory', 'address', 'socket', 'pending', 'wakeup', 'tasks',
+        'peers', 'peers_refreshed', 'sent', 'received', 'dropped')
+
+    MAX_DATAGRAM = 65536
+    PEERS_TTL = 1.0
+
+    def __init__(self, directory: str, name: str=None):
+        if name is None:
+            name = str(os.getpid())
+        self.directory = directory
+        self.address = os.path.join(directory, f'{name}.sock')
+        self.socket = None
+        self.pending = []
+        self.wakeup = curio.Event()
+        self.tasks = []
+        self.peers = ()
+        self.peers_refreshed = 0.0
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+
+    async def start(self, deliver: Deliver):
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        self.socket = curio.socket.socket(
+            curio.socket.AF_UNIX, curio.socket.SOCK_DGRAM)
+        self.socket.bind(self.address)
+        self.tasks = [
+            await curio.spawn(self._flush, daemon=True),
+            await curio.spawn(self._receive, deliver, daemon=True),
+        ]
+
+    async def stop(self):
+        for task in self.tasks:
+            await task.cancel()
+        self.tasks = []
+        if self.socket is not None:
+            await self.socket.close()
+            self.socket = None
+            os.unlink(self.address)
+
+    async def publish(self, topic: str, data):
+        self.pending.append((topic, data))
+        if not self.wakeup.is_set():
+            await self.wakeup.set()
+
+    def refresh_peers(self):
+        now = monotonic()
+        if now - self.peers_refreshed > self.PEERS_TTL:
+            self.peers = tuple(
+                os.path.join(self.directory, name)
+                for name in os.listdir(self.directory)
+                if name.endswith('.sock'))
+            self.peers_refreshed = now
+        return self.peers
+
+    def datagrams(self, batch: list):
+        entries, size = [], 0
+        for topic, data in batch:
+            entry = encode(topic, data)
+            if entries and size + len(entry) > self.MAX_DATAGRAM:
+                yield b''.join(entries)
+                entries, size = [], 0
+            entries.append(entry)
+            size += len(entry)
+        if entries:
+            yield b''.join(entries)
+
+    async def _flush(self):
+        while True:
+            await self.wakeup.wait()
+            # Let the current tick publish everything it has.
+            await curio.sleep(0)
+            self.wakeup.clear()
+            batch, self.pending = self.pending, []
+            peers = [peer for peer in self.refresh_peers()
+                     if peer != self.address]
+            for datagram in self.datagrams(batch):
+                for peer in peers:
+                    try:
+                        await self.socket.sendto(datagram, peer)
+                    except (ConnectionRefusedError, FileNotFoundError):
+                        # That worker is gone.
+                        self.peers_refreshed = 0.0
+                        self.dropped += 1
+                    except OSError:
+                        # Most likely too large a datagram.
+                        self.dropped += 1
+                    else:
+                        self.sent += 1
+
+    async def _receive(self, deliver: Deliver):
+        while True:
+            datagram = await self.socket.recv(self.MAX_DATAGRAM * 4)
+            self.received += 1
+            for topic, data in decode(datagram):
+                await deliver(topic, data)
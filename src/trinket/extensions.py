@@ -1,4 +1,19 @@
+import sys
 import logging
+import threading
+from random import random
+from time import perf_counter
+from curio import spawn, sleep, run_in_thread, Lock
+from trinket.access import AccessLog
+from trinket.broker import Broker
+from trinket import introspection
+from trinket.http import HTTPStatus, HTTPError
+from trinket.metrics import Metrics, render
+from trinket.monitor import LagMonitor
+from trinket.profiling import (
+    RouteIndex, AllocationTracer, sample, collapsed)
+from trinket.response import Response
+from trinket.websockets import Keepalive
 
 
 def logger(app, level=logging.DEBUG):
@@ -20,3 +35,274 @@ def logger(app, level=logging.DEBUG):
         logger.removeHandler(handler)
 
     return app
+
+
+def pubsub(app, broker: Broker):
+
+    app.broker = broker
+
+    @app.listen('startup')
+    async def start_broker():
+        await broker.start(app.deliver)
+
+    @app.listen('shutdown')
+    async def stop_broker():
+        await broker.stop()
+
+    return app
+
+
+def keepalive(app, interval: float=20.0, timeout: float=10.0,
+              idle: float=None):
+
+    sweeper = Keepalive(app.websockets, interval, timeout, idle)
+    task = None
+
+    @app.listen('startup')
+    async def start_keepalive():
+        nonlocal task
+        task = await spawn(sweeper.run, daemon=True)
+
+    @app.listen('shutdown')
+    async def stop_keepalive():
+        if task is not None:
+            await task.cancel()
+
+    return app
+
+
+def metrics(app, path: str='/metrics', directory: str=None,
+            interval: float=5.0, bounds: tuple=None):
+
+    recorder = Metrics(directory, bounds)
+    task = None
+
+    @app.listen('request')
+    async def start_request(request):
+        if not request.upgrade:
+            recorder.start(request)
+
+    @app.listen('response')
+    async def observe_response(request, response):
+        size = len(response.body) if response.stream is None else 0
+        recorder.observe(request, response.status.value, size)
+
+    @app.listen('error')
+    async def observe_error(request, exc):
+        recorder.observe(request, exc.status.value, len(exc.message))
+
+    @app.listen('finished')
+    async def finish_request(request):
+        recorder.finish(request)
+
+    async def take_snapshot():
+        snapshot = recorder.snapshot(len(app.websockets))
+        await app.notify('metrics', snapshot['gauges'])
+        return snapshot
+
+    @app.route(path)
+    async def expose(request):
+        snapshot = await take_snapshot()
+        if directory is not None:
+            # Other workers' files: off the kernel.
+            snapshot = await app.threads.run(recorder.collect, snapshot)
+        return Response(body=render(snapshot).encode(), headers={
+            'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    async def dump():
+        while True:
+            await app.threads.run(recorder.dump, await take_snapshot())
+            await sleep(interval)
+
+    @app.listen('startup')
+    async def start_dumping():
+        nonlocal task
+        if directory is not None:
+            task = await spawn(dump, daemon=True)
+
+    @app.listen('shutdown')
+    async def stop_dumping():
+        if task is not None:
+            await task.cancel()
+            recorder.discard()
+
+    return app
+
+
+def timing(app, header: bool=True, slow: float=None, level=logging.WARNING):
+
+    app.channel = type('Channel', (app.channel,), {'TIMINGS': True})
+    logger = logging.getLogger('trinket.slow')
+
+    if header:
+        @app.listen('response')
+        async def server_timing(request, response):
+            response.headers['Server-Timing'] = request.timings.header()
+
+    if slow is not None:
+        @app.listen('sent')
+        async def log_slow(request, response):
+            timings = request.timings
+            if timings.written - timings.started > slow:
+                logger.log(
+                    level, '%s %s took %.1fms: %s', request.method,
+                    request.url.decode(), timings.total * 1000,
+                    timings.header())
+
+    return app
+
+
+def monitor(app, interval: float=0.1):
+
+    lag = LagMonitor(interval)
+    task = None
+
+    @app.listen('startup')
+    async def start_monitor():
+        nonlocal task
+        task = await spawn(lag.run, daemon=True)
+
+    @app.listen('shutdown')
+    async def stop_monitor():
+        if task is not None:
+            await task.cancel()
+
+    @app.listen('metrics')
+    async def lag_gauges(gauges):
+        gauges.update(lag.gauges())
+
+    return app
+
+
+def local_only(request) -> bool:
+    return request.socket.getpeername()[0] in ('127.0.0.1', '::1')
+
+
+def profiler(app, prefix: str='/_admin', authorize=local_only,
+             max_seconds: float=60.0):
+
+    profiling, tracing = Lock(), Lock()
+
+    def arguments(request, lock):
+        if not authorize(request):
+            raise HTTPError(HTTPStatus.FORBIDDEN)
+        if lock.locked():
+            raise HTTPError(HTTPStatus.CONFLICT, 'Already running.')
+        return min(request.query.float('seconds', 5.0), max_seconds)
+
+    @app.route(prefix + '/profile')
+    async def profile(request):
+        seconds = arguments(request, profiling)
+        interval = request.query.float('interval', 0.005)
+        if interval <= 0:
+            raise HTTPError(
+                HTTPStatus.BAD_REQUEST, 'The interval must be positive.')
+        async with profiling:
+            # The kernel runs in this very thread.
+            stacks = await run_in_thread(
+                sample, RouteIndex(app.routes), threading.get_ident(),
+                seconds, interval)
+        return Response.raw(collapsed(stacks).encode())
+
+    @app.route(prefix + '/allocations')
+    async def allocations(request):
+        seconds = arguments(request, tracing)
+        top = request.query.int('top', 20)
+        async with tracing:
+            tracer = AllocationTracer(RouteIndex(app.routes))
+            await run_in_thread(tracer.start)
+            try:
+                await sleep(seconds)
+            finally:
+                differences = await run_in_thread(tracer.stop)
+        lines = [
+            f'{size:+d} B {count:+d} {route} {location}'
+            for route, size, count, location in
+            tracer.by_route(differences)[:top]]
+        return Response.raw('\n'.join(lines).encode())
+
+    return app
+
+
+def access_log(app, stream=None, path: str=None, size: int=4096,
+               rate: float=1.0, interval: float=0.5):
+
+    records = AccessLog(size)
+    task = None
+    # Request key: several access logs may coexist.
+    started = object()
+
+    @app.listen('request')
+    async def start_record(request):
+        if rate >= 1.0 or random() < rate:
+            request[started] = perf_counter()
+
+    @app.listen('response')
+    async def record_response(request, response):
+        since = request.pop(started, None)
+        if since is not None:
+            records.record(
+                request.method, request.path, response.status.value,
+                len(response.body) if response.stream is None else 0,
+                perf_counter() - since)
+
+    @app.listen('error')
+    async def record_error(request, exc):
+        since = request.pop(started, None)
+        if since is not None:
+            records.record(
+                request.method, request.path, exc.status.value,
+                len(exc.message), perf_counter() - since)
+
+    def write(batch):
+        stream.write(records.format(batch))
+        stream.flush()
+
+    async def flush():
+        batch = records.take()
+        if batch:
+            # A slow disk only holds a worker thread.
+            await run_in_thread(write, batch)
+
+    async def flushing():
+        while True:
+            await sleep(interval)
+            await flush()
+
+    @app.listen('startup')
+    async def start_flushing():
+        nonlocal task, stream
+        if path is not None:
+            stream = await run_in_thread(open, path, 'a')
+        elif stream is None:
+            stream = sys.stderr
+        task = await spawn(flushing, daemon=True)
+
+    @app.listen('shutdown')
+    async def stop_flushing():
+        if task is None:
+            # Never started: there is no stream to flush to.
+            return
+        await task.cancel()
+        await flush()
+        if path is not None:
+            await run_in_thread(stream.close)
+
+    return app
+
+
+def introspect(app, prefix: str='/_admin', authorize=local_only):
+
+    @app.route(prefix + '/connections')
+    async def connections(request):
+        if not authorize(request):
+            raise HTTPError(HTTPStatus.FORBIDDEN)
+        return Response.json({
+            'connections': introspection.connections(app),
+            'tasks': await introspection.tasks(),
+            'websockets': introspection.websockets(app),
+            'threads': app.threads.stats(),
+            'processes': app.processes.stats(),
+        })
+
+    return app
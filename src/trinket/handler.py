@@ -1,6 +1,5 @@
 import socket
 from curio.io import Socket
-from trinket.request import Channel
 from trinket.response import response_handler
 from trinket.http import HTTPError
 from typing import Callable
@@ -8,15 +7,30 @@ from typing import Callable
 
 async def request_handler(app: Callable, client: Socket, *args):
     async with client:
+        channel = app.channel(client)
+        app.connections.add(channel)
         try:
-            async for request in Channel(client):
+            async for request in channel:
                 response = await app(request)
                 if response is None:
                     break
-                await response_handler(client, response)
+                if request.keep_alive and not channel.reusable:
+                    request.keep_alive = False
+                    response.headers['Connection'] = 'close'
+                channel.state = channel.WRITING
+                channel.bytes_out += await response_handler(
+                    client, response, app.threads, request.timings)
+                channel.served += 1
+                if request.timings is not None:
+                    # Timed requests only: the phases are all known.
+                    await app.notify('sent', request, response)
         except HTTPError as exc:
-            await client.sendall(bytes(exc))
+            data = bytes(exc)
+            channel.bytes_out += len(data)
+            await client.sendall(data)
         except (ConnectionResetError, BrokenPipeError, socket.timeout):
             # The client disconnected or the network is suddenly
             # unreachable.
             pass
+        finally:
+            app.connections.discard(channel)
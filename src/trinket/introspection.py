@@ -0,0 +1,88 @@
+from time import monotonic
+
+try:
+    from curio.traps import _get_kernel
+except ImportError:
+    _get_kernel = None
+
+
+def peer(socket) -> str:
+    try:
+        host, port = socket.getpeername()[:2]
+    except OSError:
+        # Gone meanwhile.
+        return None
+    return f'{host}:{port}'
+
+
+def connections(app, now: float=None) -> list:
+    """The open HTTP connections of `app`, websockets included.
+    """
+    if now is None:
+        now = monotonic()
+    websockets = {websocket.socket: websocket for websocket in app.websockets}
+    report = []
+    for channel in tuple(app.connections):
+        request = channel.request
+        websocket = websockets.get(channel.socket)
+        connection = {
+            'peer': peer(channel.socket),
+            'age': now - channel.opened,
+            'served': channel.served,
+            'bytes_in': channel.bytes_in,
+            'bytes_out': channel.bytes_out,
+            'state': channel.state,
+            'route': request.route if request is not None else None,
+        }
+        if websocket is not None:
+            connection['state'] = 'websocket'
+            connection['websocket'] = {
+                'age': now - websocket.opened,
+                'bytes_in': websocket.bytes_in,
+                'bytes_out': websocket.bytes_out,
+                'writes': websocket.writes,
+                'idle': now - websocket.last_seen,
+                **websocket.stats(),
+            }
+        report.append(connection)
+    return report
+
+
+async def kernel_tasks() -> list:
+    """The tasks of the running kernel, or None if they can't be listed.
+
+    curio has no public API for this: the only use of its private
+    `_get_kernel` trap and `Kernel._tasks` mapping, as of curio 0.9.
+    Should they change, the report goes without the tasks.
+    """
+    if _get_kernel is None:
+        return None
+    kernel = await _get_kernel()
+    table = getattr(kernel, '_tasks', None)
+    if table is None:
+        return None
+    return list(table.values())
+
+
+async def tasks() -> dict:
+    listed = await kernel_tasks()
+    if listed is None:
+        return {'total': None, 'states': {}}
+    states = {}
+    for task in listed:
+        states[task.state] = states.get(task.state, 0) + 1
+    return {'total': len(listed), 'states': states}
+
+
+def websockets(app) -> dict:
+    totals = {
+        'open': len(app.websockets), 'queued': 0, 'dropped': 0, 'peak': 0,
+        'incoming': 0}
+    for websocket in tuple(app.websockets):
+        stats = websocket.stats()
+        totals['queued'] += stats['queued']
+        totals['dropped'] += stats['dropped']
+        totals['peak'] = max(totals['peak'], stats['peak'])
+        if websocket._incoming is not None:
+            totals['incoming'] += len(websocket._incoming)
+    return totals
@@ -1,13 +1,27 @@
 from functools import wraps
+from time import perf_counter
+from trinket.http import HTTPError
 
 
 def handler_events(func):
     @wraps(func)
     async def dispatch(app, request, *args, **kwargs):
-        response = await app.notify('request', request)
-        if response is None:
-            response = await func(app, request, *args, **kwargs)
-        if response is not None:
-            await app.notify('response', request, response)
-        return response
+        try:
+            try:
+                response = await app.notify('request', request)
+                if request.timings is not None:
+                    request.timings.hooks = perf_counter()
+                if response is None:
+                    response = await func(app, request, *args, **kwargs)
+            except HTTPError as exc:
+                await app.notify('error', request, exc)
+                raise
+            if response is not None:
+                await app.notify('response', request, response)
+                if request.timings is not None:
+                    request.timings.response = perf_counter()
+            return response
+        finally:
+            # However the request ended: answered, failed or aborted.
+            await app.notify('finished', request)
     return dispatch
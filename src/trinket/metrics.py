@@ -0,0 +1,236 @@
+import os
+import json
+from bisect import bisect_left
+from time import perf_counter, time
+
+
+# Request key holding the start of the request: private, unlike a
+# string, it can't clash with the keys of the application.
+STARTED = object()
+UNMATCHED = '<unmatched>'
+
+
+class RouteMetrics:
+    """Counters of one route template.
+
+    `buckets` counts the requests per latency bucket, not cumulated:
+    the last one is for the requests slower than every bound.
+    """
+
+    __slots__ = (
+        'buckets', 'total', 'statuses', 'request_bytes', 'response_bytes')
+
+    def __init__(self, size: int):
+        self.buckets = [0] * size
+        self.total = 0.0
+        self.statuses = {}
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+    def snapshot(self) -> dict:
+        return {
+            'buckets': list(self.buckets),
+            'total': self.total,
+            'statuses': {str(code): count
+                         for code, count in self.statuses.items()},
+            'request_bytes': self.request_bytes,
+            'response_bytes': self.response_bytes,
+        }
+
+
+class Metrics:
+    """Per-route request metrics, in the Prometheus text format.
+
+    Recording is a few list and dict increments: the buckets of a
+    route are allocated once, when it is first requested.
+    With a `directory`, each worker dumps its snapshot there, named
+    after its pid unless `name` is given, and `collect` merges those
+    of all the live workers.
+    The `gauges` of a snapshot are free for the extensions to fill, from
+    the `metrics` hook. Merged, they hold the worst value of the workers.
+    """
+
+    __slots__ = ('bounds', 'routes', 'in_flight', 'directory', 'address')
+
+    BOUNDS = (
+        0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+        0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    # Snapshots older than that are from a dead worker.
+    STALE = 10.0
+
+    def __init__(self, directory: str=None, bounds: tuple=None,
+                 name: str=None):
+        self.bounds = tuple(bounds or self.BOUNDS)
+        self.routes = {}
+        self.in_flight = 0
+        self.directory = directory
+        self.address = None
+        if directory is not None:
+            if name is None:
+                name = str(os.getpid())
+            self.address = os.path.join(directory, f'{name}.json')
+
+    def start(self, request):
+        request[STARTED] = perf_counter()
+        self.in_flight += 1
+
+    def observe(self, request, status: int, size: int):
+        started = request.pop(STARTED, None)
+        if started is None:
+            # Not started: a websocket upgrade.
+            return
+        elapsed = perf_counter() - started
+        self.in_flight -= 1
+        template = request.route or UNMATCHED
+        route = self.routes.get(template)
+        if route is None:
+            route = self.routes[template] = RouteMetrics(len(self.bounds) + 1)
+        route.buckets[bisect_left(self.bounds, elapsed)] += 1
+        route.total += elapsed
+        statuses = route.statuses
+        statuses[status] = statuses.get(status, 0) + 1
+        length = request.headers.get('Content-Length')
+        if length is not None:
+            route.request_bytes += int(length)
+        route.response_bytes += size
+
+    def finish(self, request):
+        """Ends a request that was never observed: it failed, its
+        handler returned nothing or its client went away.
+        """
+        if request.pop(STARTED, None) is not None:
+            self.in_flight -= 1
+
+    def snapshot(self, websockets: int=0) -> dict:
+        return {
+            'bounds': self.bounds,
+            'in_flight': self.in_flight,
+            'websockets': websockets,
+            'gauges': {},
+            'routes': {template: route.snapshot()
+                       for template, route in self.routes.items()},
+        }
+
+    def dump(self, snapshot: dict):
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        temporary = self.address + '.tmp'
+        with open(temporary, 'w') as dump:
+            json.dump(snapshot, dump)
+        # Readers never see a partial file.
+        os.replace(temporary, self.address)
+
+    def discard(self):
+        if self.address is not None and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def collect(self, snapshot: dict) -> dict:
+        """The snapshots of all the workers, merged.
+        `snapshot`, the one of this worker, is dumped first.
+        """
+        if self.directory is None:
+            return snapshot
+        self.dump(snapshot)
+        snapshots = []
+        now = time()
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.stat(path).st_mtime > self.STALE:
+                    continue
+                with open(path) as dump:
+                    snapshots.append(json.load(dump))
+            except (OSError, ValueError):
+                # Gone or being replaced.
+                continue
+        return merge(snapshots)
+
+
+def merge(snapshots: list) -> dict:
+    merged = {'in_flight': 0, 'websockets': 0, 'gauges': {}, 'routes': {}}
+    for snapshot in snapshots:
+        merged['in_flight'] += snapshot['in_flight']
+        merged['websockets'] += snapshot['websockets']
+        gauges = merged['gauges']
+        for name, value in snapshot.get('gauges', {}).items():
+            gauges[name] = max(value, gauges.get(name, value))
+        if 'bounds' in snapshot:
+            merged['bounds'] = tuple(snapshot['bounds'])
+        for template, route in snapshot['routes'].items():
+            into = merged['routes'].get(template)
+            if into is None:
+                into = merged['routes'][template] = {
+                    'buckets': [0] * len(route['buckets']),
+                    'total': 0.0, 'statuses': {},
+                    'request_bytes': 0, 'response_bytes': 0}
+            into['buckets'] = [
+                a + b for a, b in zip(into['buckets'], route['buckets'])]
+            into['total'] += route['total']
+            into['request_bytes'] += route['request_bytes']
+            into['response_bytes'] += route['response_bytes']
+            for code, count in route['statuses'].items():
+                into['statuses'][code] = into['statuses'].get(code, 0) + count
+    return merged
+
+
+def label(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n')
+
+
+def render(snapshot: dict) -> str:
+    lines = []
+    routes = sorted(snapshot['routes'].items())
+    bounds = snapshot.get('bounds', Metrics.BOUNDS)
+
+    lines.append('# HELP trinket_requests_total Requests, by status.')
+    lines.append('# TYPE trinket_requests_total counter')
+    for template, route in routes:
+        for code, count in sorted(route['statuses'].items()):
+            lines.append(
+                f'trinket_requests_total{{route="{label(template)}",'
+                f'status="{code}"}} {count}')
+
+    lines.append(
+        '# HELP trinket_request_duration_seconds Time to the response.')
+    lines.append('# TYPE trinket_request_duration_seconds histogram')
+    for template, route in routes:
+        name = label(template)
+        cumulated = 0
+        for bound, count in zip(bounds, route['buckets']):
+            cumulated += count
+            lines.append(
+                f'trinket_request_duration_seconds_bucket{{route="{name}",'
+                f'le="{bound}"}} {cumulated}')
+        cumulated += route['buckets'][-1]
+        lines.append(
+            f'trinket_request_duration_seconds_bucket{{route="{name}",'
+            f'le="+Inf"}} {cumulated}')
+        lines.append(
+            f'trinket_request_duration_seconds_sum{{route="{name}"}} '
+            f'{route["total"]}')
+        lines.append(
+            f'trinket_request_duration_seconds_count{{route="{name}"}} '
+            f'{cumulated}')
+
+    for kind in ('request', 'response'):
+        lines.append(
+            f'# HELP trinket_{kind}_bytes_total Size of the {kind} bodies.')
+        lines.append(f'# TYPE trinket_{kind}_bytes_total counter')
+        for template, route in routes:
+            lines.append(
+                f'trinket_{kind}_bytes_total{{route="{label(template)}"}} '
+                f'{route[kind + "_bytes"]}')
+
+    lines.append('# HELP trinket_requests_in_flight Requests being handled.')
+    lines.append('# TYPE trinket_requests_in_flight gauge')
+    lines.append(f'trinket_requests_in_flight {snapshot["in_flight"]}')
+    lines.append('# HELP trinket_websockets Open websockets.')
+    lines.append('# TYPE trinket_websockets gauge')
+    lines.append(f'trinket_websockets {snapshot["websockets"]}')
+    for name, value in sorted(snapshot.get('gauges', {}).items()):
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
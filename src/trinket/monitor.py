@@ -0,0 +1,88 @@
+import logging
+from time import monotonic
+from curio import sleep
+from curio.debug import longblock
+from trinket.request import Request
+
+
+logger = logging.getLogger('trinket.monitor')
+
+
+class LagMonitor:
+    """Measures how late the kernel wakes up a sleeping task.
+
+    Any lag is time a task spent running without giving the kernel
+    back: every other connection of the worker waited that long.
+    """
+
+    __slots__ = ('interval', 'lag', 'max', 'samples', 'total')
+
+    def __init__(self, interval: float=0.1):
+        self.interval = interval
+        self.lag = 0.0
+        self.max = 0.0
+        self.samples = 0
+        self.total = 0.0
+
+    def record(self, lag: float):
+        self.lag = lag
+        self.samples += 1
+        self.total += lag
+        if lag > self.max:
+            self.max = lag
+
+    async def run(self):
+        while True:
+            before = monotonic()
+            await sleep(self.interval)
+            self.record(max(0.0, monotonic() - before - self.interval))
+
+    def gauges(self) -> dict:
+        return {
+            'trinket_loop_lag_seconds': self.lag,
+            'trinket_loop_lag_max_seconds': self.max,
+        }
+
+
+def _frames(coro):
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(
+            coro, 'ag_frame', None)
+        if frame is None:
+            break
+        yield frame
+        coro = getattr(coro, 'cr_await', None) or getattr(
+            coro, 'ag_await', None)
+
+
+def blamed(task) -> str:
+    """The request being handled by `task`, if any, and where it is.
+    """
+    request = location = None
+    for frame in _frames(task.coro):
+        candidate = frame.f_locals.get('request')
+        if isinstance(candidate, Request):
+            request = candidate
+        location = f'{frame.f_code.co_filename}:{frame.f_lineno}'
+    if request is None:
+        return location or ''
+    return f'{request.method} {request.route or request.path} at {location}'
+
+
+class blocking(longblock):
+    """curio debugger reporting the tasks that held the kernel for more
+    than `max_time` seconds, with the route they were handling.
+    Meant for debugging: inspecting the task is not free.
+    """
+
+    def __init__(self, *, max_time=0.05, level=logging.WARNING,
+                 log=logger, **kwargs):
+        super().__init__(max_time=max_time, level=level, log=log, **kwargs)
+
+    def suspended(self, task):
+        if self.check_filter(task):
+            duration = monotonic() - self.start
+            if duration > self.max_time:
+                self.log.log(
+                    self.level, '%r blocked for %.3f seconds: %s',
+                    task, duration, blamed(task))
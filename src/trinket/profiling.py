@@ -0,0 +1,145 @@
+import os
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from dis import findlinestarts
+from inspect import unwrap
+
+
+NO_ROUTE = '<no route>'
+
+
+def handlers(routes):
+    """(route template, handler function) of every route in `routes`.
+    """
+    nodes = [routes.root]
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(edge.child for edge in node.edges or ())
+        if node.payload:
+            route = node.payload.get('route', node.path)
+            for method, handler in node.payload.items():
+                if method.isupper() and callable(handler):
+                    yield route, unwrap(handler)
+
+
+class RouteIndex:
+    """Attributes code locations to the route handlers they belong to.
+    """
+
+    __slots__ = ('codes', 'lines')
+
+    def __init__(self, routes):
+        self.codes = {}
+        self.lines = {}
+        for route, handler in handlers(routes):
+            code = getattr(handler, '__code__', None)
+            if code is None:
+                continue
+            self.codes[code] = route
+            last = max(line for _, line in findlinestarts(code))
+            self.lines.setdefault(code.co_filename, []).append(
+                (code.co_firstlineno, last, route))
+
+    def from_frames(self, frame) -> str:
+        while frame is not None:
+            route = self.codes.get(frame.f_code)
+            if route is not None:
+                return route
+            frame = frame.f_back
+        return NO_ROUTE
+
+    def from_traceback(self, traceback) -> str:
+        for frame in traceback:
+            for first, last, route in self.lines.get(frame.filename, ()):
+                if first <= frame.lineno <= last:
+                    return route
+        return NO_ROUTE
+
+
+def label(code) -> str:
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:' \
+           f'{code.co_firstlineno})'
+
+
+def sample(index: RouteIndex, thread: int, duration: float,
+           interval: float) -> Counter:
+    """Collapsed stacks of `thread`, prefixed by their route, counted
+    over `duration` seconds. Runs in a thread of its own: the sampled
+    thread is only held by the GIL, for the time of a stack walk.
+    A sample is taken when the sampled thread lets the GIL go: when it
+    waits for I/O, or at the switch interval while it computes.
+    """
+    stacks = Counter()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread)
+        if frame is None:
+            break
+        route = index.from_frames(frame)
+        stack = []
+        while frame is not None:
+            stack.append(label(frame.f_code))
+            frame = frame.f_back
+        stack.append(route)
+        stacks[';'.join(reversed(stack))] += 1
+        del frame
+        time.sleep(interval)
+    return stacks
+
+
+def collapsed(stacks: Counter) -> str:
+    """In the format of flamegraph.pl and speedscope.
+    """
+    return ''.join(
+        f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+
+class AllocationTracer:
+    """Difference between two `tracemalloc` snapshots, by route.
+    """
+
+    __slots__ = ('index', 'nframes', 'before', 'started')
+
+    def __init__(self, index: RouteIndex, nframes: int=25):
+        self.index = index
+        self.nframes = nframes
+        self.before = None
+        self.started = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.nframes)
+            self.started = True
+        self.before = tracemalloc.take_snapshot()
+
+    def stop(self) -> list:
+        after = tracemalloc.take_snapshot()
+        if self.started:
+            tracemalloc.stop()
+            self.started = False
+        ignored = (tracemalloc.Filter(False, tracemalloc.__file__),)
+        differences = after.filter_traces(ignored).compare_to(
+            self.before.filter_traces(ignored), 'traceback')
+        self.before = None
+        return differences
+
+    def by_route(self, differences: list) -> list:
+        """(route, size difference, count difference, top location),
+        the largest growth first.
+        """
+        routes = {}
+        for stat in differences:
+            if not stat.size_diff:
+                continue
+            route = self.index.from_traceback(stat.traceback)
+            size, count, top = routes.get(route, (0, 0, None))
+            if top is None or stat.size_diff > top[0]:
+                top = (stat.size_diff, str(stat.traceback[0]))
+            routes[route] = (
+                size + stat.size_diff, count + stat.count_diff, top)
+        return sorted(
+            ((route, size, count, top[1])
+             for route, (size, count, top) in routes.items()),
+            key=lambda item: item[1], reverse=True)
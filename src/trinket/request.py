@@ -1,13 +1,59 @@
+from collections import deque
+from time import monotonic, perf_counter
 from biscuits import parse
 from trinket.http import HTTPStatus, HTTPError, Query
 from trinket.parsers import CONTENT_TYPES_PARSERS
+from trinket.timing import Timings
 from httptools import HttpParserUpgrade, HttpParserError, HttpRequestParser
 from httptools.parser.errors import HttpParserInvalidMethodError
 from httptools import parse_url
 from urllib.parse import parse_qs, unquote
 
 
+# Drained bytes are thrown away: all the connections share one buffer.
+_discard = bytearray(65536)
+
+CONTINUE = b'HTTP/1.1 100 Continue\r\n\r\n'
+
+HEADERS_TOO_LARGE = bytes(HTTPError(
+    HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, 'Request headers too large.'))
+
+
+class HeadersTooLarge(HTTPError):
+    """The 431 of oversized headers. Raised anew each time, so that no
+    traceback outlives its connection; the response is serialized once.
+    """
+
+    __slots__ = ()
+
+    def __init__(self):
+        self.status = HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE
+        self.message = b'Request headers too large.'
+
+    def __bytes__(self):
+        return HEADERS_TOO_LARGE
+
+
 class Channel:
+    """HTTP/1.1 connection, yielding the requests as they are parsed.
+
+    With `RECYCLE`, the `Request` object and its headers container are
+    blanked and reused for the next request of the same connection.
+    Handlers must then not keep a reference to a request past its
+    response.
+    With `RELEASE_IDLE`, the parser and the request are dropped after
+    each response: an idle keep-alive connection only holds its socket.
+    A body left unread by the handler is drained if at most
+    `DRAIN_THRESHOLD` bytes of it remain, else the connection is closed.
+    Requests over `MAX_HEADERS_SIZE` bytes until the end of the headers,
+    `MAX_HEADERS` headers or `MAX_HEADER_VALUE` bytes for a single value
+    are refused with a 431.
+    With `TIMINGS`, each request records the `Timings` of its phases.
+    The `state` of the connection and its counters are kept for
+    introspection.
+    Pipelined requests, received before the one being served is
+    answered, are kept `pending` and served in order.
+    """
 
     __slots__ = (
         'parser',
@@ -16,67 +62,163 @@ class Channel:
         'headers_complete',
         'socket',
         'reader',
+        'spare',
+        'received',
+        'draining',
+        'headers_size',
+        'headers_count',
+        'state',
+        'opened',
+        'served',
+        'bytes_in',
+        'bytes_out',
+        'pending',
+        'serving',
     )
 
+    IDLE = 'idle'
+    HEADERS = 'headers'
+    BODY = 'body'
+    HANDLER = 'handler'
+    WRITING = 'writing'
+
+    RECYCLE = False
+    RELEASE_IDLE = False
+    DRAIN_THRESHOLD = 65536
+    MAX_HEADERS_SIZE = 65536
+    MAX_HEADERS = 100
+    MAX_HEADER_VALUE = 8192
+    TIMINGS = False
+
     def __init__(self, socket):
         self.complete = False
         self.headers_complete = False
-        self.parser = HttpRequestParser(self)
+        # Created on the first bytes received.
+        self.parser = None
         self.request = None
         self.socket = socket
-        self.reader = self._reader()
+        # Only created if the body is not entirely received with the
+        # headers: most GET requests never need it.
+        self.reader = None
+        self.spare = None
+        self.received = 0
+        self.draining = False
+        self.headers_size = 0
+        self.headers_count = 0
+        self.state = self.IDLE
+        self.opened = monotonic()
+        self.served = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.pending = deque()
+        self.serving = None
 
     def data_received(self, data: bytes):
+        if self.parser is None:
+            self.parser = HttpRequestParser(self)
+        if not self.headers_complete:
+            # Counted before parsing: the parser buffers incomplete
+            # headers, whatever their size.
+            self.headers_size += len(data)
+            if self.headers_size > self.MAX_HEADERS_SIZE:
+                raise HeadersTooLarge()
         try:
             self.parser.feed_data(data)
         except HttpParserUpgrade:
             self.request.upgrade = True
         except (HttpParserError, HttpParserInvalidMethodError) as exc:
+            if isinstance(exc.__context__, HTTPError):
+                # Raised from within a parser callback.
+                raise exc.__context__
             # We should log the exc.
             raise HTTPError(
                 HTTPStatus.BAD_REQUEST, 'Unparsable request.')
 
-    async def read(self, parse: bool=True) -> bytes:
+    async def read(self) -> bytes:
         data = await self.socket.recv(1024)
         if data:
-            if parse:
-                self.data_received(data)
+            self.bytes_in += len(data)
+            self.data_received(data)
             return data
 
     async def _reader(self) -> bytes:
-        while not self.complete:
+        if self.request.expect_continue:
+            # The body is wanted: the client may now send it.
+            self.request.expect_continue = False
+            await self.socket.sendall(CONTINUE)
+            self.bytes_out += len(CONTINUE)
+        self.state = self.BODY
+        request = self.request
+        # Past the end of the body, a pipelined request replaces it.
+        while self.request is request and not self.complete:
             data = await self.read()
             if not data:
                 break
             yield data
+        self.state = self.HANDLER
 
-    async def _drainer(self) -> bytes:
-        while True:
-            data = await self.read(parse=False)
-            if not data:
+    async def drain(self):
+        """Parse the rest of the body without keeping it.
+        """
+        self.draining = True
+        view = memoryview(_discard)
+        request = self.request
+        while self.request is request and not self.complete:
+            size = await self.socket.recv_into(_discard)
+            if not size:
                 break
-            yield data
+            self.bytes_in += size
+            self.data_received(view[:size])
 
     def on_header(self, name: bytes, value: bytes):
+        self.headers_count += 1
+        if self.headers_count > self.MAX_HEADERS or \
+           len(value) > self.MAX_HEADER_VALUE:
+            raise HeadersTooLarge()
         value = value.decode()
         if value:
             name = name.decode().title()
-            if name in self.request.headers:
-                self.request.headers[name] += ', {}'.format(value)
+            headers = self.request.headers
+            if name in headers:
+                headers[name] = headers[name] + ', ' + value
             else:
-                self.request.headers[name] = value
+                headers[name] = value
 
     def on_body(self, data: bytes):
-        self.request.body += data
+        self.received += len(data)
+        if not self.draining:
+            self.request.body += data
 
     def on_message_begin(self):
+        if self.request is not None:
+            # Pipelined: the previous request is complete.
+            if self.request is not self.serving:
+                self.pending.append(self.request)
+            self.received = 0
+            self.draining = False
+            self.headers_size = 0
+            self.headers_count = 0
+            self.headers_complete = False
         self.complete = False
-        self.request = Request(self.socket, self.reader)
+        self.state = self.HEADERS
+        if self.spare is not None:
+            self.request, self.spare = self.spare, None
+        else:
+            self.request = Request(self.socket, None)
+        if self.TIMINGS:
+            self.request.timings = Timings()
 
     def on_message_complete(self):
         self.complete = True
+        timings = self.request.timings
+        if timings is not None and timings.hooks is None:
+            # Received before the request is handled.
+            timings.body = perf_counter()
 
     def on_url(self, url: bytes):
+        # Called for each part of an url split across reads.
+        if self.request.url is not None:
+            url = self.request.url + url
         self.request.url = url
         parsed = parse_url(url)
         self.request.path = unquote(parsed.path.decode())
@@ -85,7 +227,52 @@ class Channel:
     def on_headers_complete(self):
         self.request.keep_alive = self.parser.should_keep_alive()
         self.request.method = self.parser.get_method().decode().upper()
+        self.request.expect_continue = self.request.headers.get(
+            'Expect', '').lower() == '100-continue'
         self.headers_complete = True
+        if self.request.timings is not None:
+            self.request.timings.headers = perf_counter()
+
+    @property
+    def reusable(self) -> bool:
+        """Whether the connection can serve another request once the
+        current one is answered.
+        """
+        if self.complete or self.serving is not self.request:
+            # A pipelined request follows the served one.
+            return True
+        if self.request.expect_continue:
+            # The client was never invited to send its body: whether
+            # it does or not is unknown, the connection can't be reused.
+            return False
+        remaining = self.remaining
+        return remaining is not None and remaining <= self.DRAIN_THRESHOLD
+
+    @property
+    def remaining(self) -> int:
+        """Body bytes yet to be received, `None` if unknown.
+        """
+        length = self.request.headers.get('Content-Length')
+        if length is None or not length.isdigit():
+            return None
+        return int(length) - self.received
+
+    def reset(self):
+        if self.RELEASE_IDLE:
+            self.parser = None
+        elif self.RECYCLE and self.request is not None:
+            self.request.reset()
+            self.spare = self.request
+        self.request = None
+        self.serving = None
+        self.reader = None
+        self.received = 0
+        self.draining = False
+        self.headers_size = 0
+        self.headers_count = 0
+        self.complete = False
+        self.headers_complete = False
+        self.state = self.IDLE
 
     async def __aiter__(self):
         keep_alive = True
@@ -93,19 +280,24 @@ class Channel:
             data = await self.read()
             if data is None:
                 break
-            if self.headers_complete:
-                yield self.request
-                keep_alive = self.request.keep_alive
-                if keep_alive:
+            while keep_alive and (self.pending or self.headers_complete):
+                if self.pending:
+                    request = self.serving = self.pending.popleft()
+                else:
+                    request = self.serving = self.request
                     if not self.complete:
+                        self.reader = request._reader = self._reader()
+                self.state = self.HANDLER
+                yield request
+                keep_alive = request.keep_alive
+                if keep_alive and request is self.request:
+                    if not self.complete:
+                        # The handler left a small part of the body
+                        # unread: see `reusable`.
                         await self.reader.aclose()
-                        # We drain if there's an uncomplete request.
-                        async for _ in self._drainer():
-                            pass
-                    self.request = None
-                    self.complete = False
-                    self.headers_complete = False
-                    self.reader = self._reader()
+                        await self.drain()
+                    if request is self.request:
+                        self.reset()
 
 
 class Request(dict):
@@ -115,6 +307,7 @@ class Request(dict):
         '_query',
         '_reader',
         'body',
+        'expect_continue',
         'files',
         'form',
         'headers',
@@ -122,7 +315,9 @@ class Request(dict):
         'method',
         'path',
         'query_string',
+        'route',
         'socket',
+        'timings',
         'upgrade',
         'url'
     )
@@ -132,6 +327,7 @@ class Request(dict):
         self._query = None
         self._reader = reader
         self.body = b''
+        self.expect_continue = False
         self.files = None
         self.form = None
         self.headers = headers
@@ -139,16 +335,46 @@ class Request(dict):
         self.method = None
         self.path = None
         self.query_string = None
+        self.route = None
         self.socket = socket
+        self.timings = None
         self.upgrade = False
         self.url = None
 
+    def reset(self):
+        """Blank the request, keeping its socket and containers."""
+        self.clear()
+        self.headers.clear()
+        self._cookies = None
+        self._query = None
+        self._reader = None
+        self.body = b''
+        self.expect_continue = False
+        self.files = None
+        self.form = None
+        self.keep_alive = False
+        self.method = None
+        self.path = None
+        self.query_string = None
+        self.route = None
+        self.timings = None
+        self.upgrade = False
+        self.url = None
+
+    def __reduce__(self):
+        # Pickles as a detached copy: the socket and the body
+        # reader can't leave the process. Used by the process pool.
+        state = {name: getattr(self, name) for name in self.__slots__
+                 if name not in ('socket', '_reader')}
+        return Request, (None, None), (None, state), None, iter(self.items())
+
     @property
     async def raw_body(self):
-        async for data in self._reader:
-            # Everything ends up in self.body due to the
-            # parsing feeding the on_body.
-            pass
+        if self._reader is not None:
+            async for data in self._reader:
+                # Everything ends up in self.body due to the
+                # parsing feeding the on_body.
+                pass
         return self.body
 
     async def parse_body(self):
@@ -162,12 +388,13 @@ class Request(dict):
             if self.body:
                 content_parser.send(self.body)
 
-            async for data in self._reader:
-                # This will populate self.body
-                # It can be a problem for large requests.
-                # we might want to do something like : self.body = b''
-                # at each iteration.
-                content_parser.send(data)
+            if self._reader is not None:
+                async for data in self._reader:
+                    # This will populate self.body
+                    # It can be a problem for large requests.
+                    # we might want to do something like : self.body = b''
+                    # at each iteration.
+                    content_parser.send(data)
         except Exception as exc:
             # do log
             raise
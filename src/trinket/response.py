@@ -6,8 +6,11 @@ except ImportError:
     import json as json
 
 import curio
+from time import perf_counter
 from collections.abc import AsyncGenerator
 from trinket.http import HTTPCode, HTTPStatus, Cookies
+from trinket.timing import Timings
+from trinket.workers import ThreadPool, iterate
 
 
 async def file_iterator(path):
@@ -19,32 +22,54 @@ async def file_iterator(path):
             yield data
 
 
-async def response_handler(client, response):
+async def response_handler(client, response, threads: ThreadPool=None,
+                           timings: Timings=None) -> int:
     """The bytes representation of the response
     contains a body only if there's no streaming
     In a case of a stream, it only contains headers.
+    Blocking synchronous streams are consumed through `threads`.
+    Returns the number of bytes written.
     """
-    await client.sendall(bytes(response))
+    data = bytes(response)
+    if timings is not None:
+        timings.serialized = perf_counter()
+    await client.sendall(data)
+    sent = len(data)
 
     if response.stream is not None:
         if isinstance(response.stream, AsyncGenerator):
             async with curio.meta.finalize(response.stream):
                 async for data in response.stream:
-                    await client.sendall(
-                        b"%x\r\n%b\r\n" % (len(data), data))
+                    chunk = b"%x\r\n%b\r\n" % (len(data), data)
+                    await client.sendall(chunk)
+                    sent += len(chunk)
+        elif response.blocking:
+            stream = iterate(response.stream, threads)
+            async with curio.meta.finalize(stream):
+                async for data in stream:
+                    chunk = b"%x\r\n%b\r\n" % (len(data), data)
+                    await client.sendall(chunk)
+                    sent += len(chunk)
         else:
             for data in response.stream:
-                await client.sendall(
-                    b"%x\r\n%b\r\n" % (len(data), data))
+                chunk = b"%x\r\n%b\r\n" % (len(data), data)
+                await client.sendall(chunk)
+                sent += len(chunk)
 
         await client.sendall(b'0\r\n\r\n')
+        sent += 5
+
+    if timings is not None:
+        timings.written = perf_counter()
+    return sent
 
 
 class Response:
     """A container for `status`, `headers` and `body`."""
 
     __slots__ = (
-        'headers', 'body', 'bodyless', '_cookies', '_status', 'stream')
+        'headers', 'body', 'bodyless', '_cookies', '_status', 'stream',
+        'blocking')
 
     BODYLESS_METHODS = frozenset(('HEAD', 'CONNECT'))
     BODYLESS_STATUSES = frozenset((
@@ -60,6 +85,7 @@ class Response:
             headers = {}
         self.headers = headers
         self.stream = None
+        self.blocking = False
 
     @property
     def status(self):
@@ -90,7 +116,8 @@ class Response:
         return cls(status=status, body=body, headers=headers)
 
     @classmethod
-    def streamer(self, gen, content_type="application/octet-stream"):
+    def streamer(self, gen, content_type="application/octet-stream",
+                 blocking=False):
         headers = {
             'Content-Type': content_type,
             'Transfer-Encoding': 'chunked',
@@ -98,6 +125,7 @@ class Response:
         }
         response = Response(headers=headers)
         response.stream = gen
+        response.blocking = blocking
         return response
 
     @property
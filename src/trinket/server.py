@@ -4,12 +4,16 @@ import curio
 from typing import Tuple
 from curio.network import tcp_server_socket, run_server
 from trinket.proto import Application
+from trinket.monitor import blocking
 
 
 class Server:
 
     __slots__ = ('socket', 'ssl', 'ready', '_sockaddr')
 
+    # Debug mode: tasks holding the kernel longer are reported.
+    LONGBLOCK = 0.05
+
     def __init__(self, host, port, *,
                  family=socket.AF_INET, backlog=100, ssl=None,
                  reuse_address=True, reuse_port=False):
@@ -47,10 +51,14 @@ class Server:
         await app.notify('shutdown')
         print('Please wait. The remaining tasks are being terminated.')
         await task.cancel()
+        # No handler is left to need them.
+        app.threads.shutdown()
+        app.processes.shutdown()
         self.ready.clear()
 
     @classmethod
     def start(cls, app: Application, host: str, port: int, debug: bool=True):
         server = cls(host, port)
-        curio.run(server.serve, app, with_monitor=debug)
+        curio.run(server.serve, app, with_monitor=debug,
+                  debug=[blocking(max_time=cls.LONGBLOCK)] if debug else None)
         print('Trinket is crumbling away...')
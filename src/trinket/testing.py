@@ -1,3 +1,4 @@
+import os
 import json
 import http.client
 import mimetypes
@@ -155,9 +156,10 @@ class Websocket(WebsocketPrototype):
             curio.socket.AF_INET, curio.socket.SOCK_STREAM)
         self.protocol = WSConnection(ConnectionType.CLIENT)
 
-    async def connect(self, path, host, port):
+    async def connect(self, path, host, port, extensions=None):
         await self.socket.connect((host, port))
-        request = Request(host=f'{host}:{port}', target=path)
+        request = Request(
+            host=f'{host}:{port}', target=path, extensions=extensions or [])
         await self.socket.sendall(self.protocol.send(request))
         upgrade_response = await self.socket.recv(8096)
         self.protocol.receive_data(upgrade_response)
@@ -166,6 +168,50 @@ class Websocket(WebsocketPrototype):
             raise Exception('Websocket handshake failed.')
 
 
+class Baseline:
+    """Throughputs of load runs, by name, stored as JSON.
+
+    A run slower than its stored throughput by more than `tolerance`,
+    a fraction of it, fails the test. Runs without a stored throughput
+    are recorded, as are all of them with `update`.
+    """
+
+    TOLERANCE = 0.1
+
+    def __init__(self, path: str, tolerance: float=TOLERANCE,
+                 update: bool=False):
+        self.path = path
+        self.tolerance = tolerance
+        self.update = update
+        self.changed = False
+        self.throughputs = {}
+        if os.path.exists(path):
+            with open(path) as baseline:
+                self.throughputs = json.load(baseline)
+
+    def check(self, name: str, result: dict, tolerance: float=None):
+        throughput = result['throughput']
+        stored = self.throughputs.get(name)
+        if stored is None or self.update:
+            self.throughputs[name] = throughput
+            self.changed = True
+            return
+        if tolerance is None:
+            tolerance = self.tolerance
+        if throughput < stored * (1 - tolerance):
+            pytest.fail(
+                f'{name}: {throughput:,.0f} req/s, '
+                f'{1 - throughput / stored:.0%} below the baseline '
+                f'of {stored:,.0f} req/s.', pytrace=False)
+
+    def save(self):
+        if self.changed:
+            with open(self.path, 'w') as baseline:
+                json.dump(
+                    self.throughputs, baseline, indent=2, sort_keys=True)
+            self.changed = False
+
+
 class LiveClient:
 
     task = None
@@ -199,9 +245,9 @@ class LiveClient:
         conn.close()
 
     @asynccontextmanager
-    async def websocket(self, resource):
+    async def websocket(self, resource, extensions=None):
         ws = Websocket()
-        await ws.connect(resource, *self.server.sockaddr)
+        await ws.connect(resource, *self.server.sockaddr, extensions)
         task = await curio.spawn(ws.flow)
         yield ws
         try:
@@ -212,6 +258,30 @@ class LiveClient:
         await task.join()
 
 
+def pytest_addoption(parser):
+    group = parser.getgroup('trinket')
+    group.addoption(
+        '--bench-baseline', default='bench-baseline.json',
+        help='JSON file of the load throughputs, from the rootdir.')
+    group.addoption(
+        '--bench-tolerance', type=float, default=Baseline.TOLERANCE,
+        help='Throughput drop, as a fraction, that fails a load test.')
+    group.addoption(
+        '--bench-update', action='store_true',
+        help='Record the load throughputs as the new baseline.')
+
+
+@pytest.fixture(scope='session')
+def bench_baseline(request):
+    config = request.config
+    baseline = Baseline(
+        os.path.join(str(config.rootdir), config.getoption('bench_baseline')),
+        config.getoption('bench_tolerance'),
+        config.getoption('bench_update'))
+    yield baseline
+    baseline.save()
+
+
 @pytest.fixture
 def app():
     return Trinket()
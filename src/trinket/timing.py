@@ -0,0 +1,60 @@
+from time import perf_counter
+
+
+class Timings:
+    """`perf_counter` marks of the end of each phase of a request.
+
+    A phase that didn't happen is left to `None`: the body that is not
+    received along with the headers is read within the handler, a
+    request hook answering skips the lookup and the handler.
+    """
+
+    __slots__ = (
+        'started', 'headers', 'body', 'hooks', 'lookup', 'handler',
+        'response', 'serialized', 'written')
+
+    # Mark: name of the phase it ends.
+    PHASES = (
+        ('headers', 'read'),
+        ('body', 'body'),
+        ('hooks', 'request'),
+        ('lookup', 'lookup'),
+        ('handler', 'handler'),
+        ('response', 'response'),
+        ('serialized', 'serialize'),
+        ('written', 'write'),
+    )
+
+    def __init__(self, started: float=None):
+        self.started = started if started is not None else perf_counter()
+        self.headers = None
+        self.body = None
+        self.hooks = None
+        self.lookup = None
+        self.handler = None
+        self.response = None
+        self.serialized = None
+        self.written = None
+
+    def durations(self) -> dict:
+        """Seconds spent in each phase that happened so far.
+        """
+        durations = {}
+        previous = self.started
+        for mark, phase in self.PHASES:
+            timestamp = getattr(self, mark)
+            if timestamp is not None:
+                durations[phase] = timestamp - previous
+                previous = timestamp
+        return durations
+
+    @property
+    def total(self) -> float:
+        return sum(self.durations().values())
+
+    def header(self) -> str:
+        """`Server-Timing` header value, in milliseconds.
+        """
+        return ', '.join(
+            f'{phase};dur={duration * 1000:.3f}'
+            for phase, duration in self.durations().items())
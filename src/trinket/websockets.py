@@ -1,97 +1,632 @@
 from abc import ABC
-from curio import socket, Queue, Event, TaskGroup
+from collections import deque
+from time import monotonic
+from curio import (
+    socket, sleep, ignore_after, timeout_after, Event, TaskGroup,
+    TaskTimeout)
+from curio.errors import ResourceBusy
 from trinket.http import HTTPStatus, HTTPError
 from wsproto import WSConnection, ConnectionType
 from wsproto.connection import ConnectionState
+from wsproto.extensions import PerMessageDeflate
+from wsproto.frame_protocol import FrameProtocol, Opcode
 from wsproto.utilities import RemoteProtocolError
 from wsproto.events import (
     Request, AcceptConnection, CloseConnection, Message, Ping)
 
 
+# Sent by the keepalive: a pong carries the same payload back.
+_ping = Ping(payload=b'trinket')
+
+
+# Queued to the incoming messages, to wake up the receivers on closure.
+CLOSED = object()
+
+# Server frames are not masked: a message frames the same for everyone.
+_framer = FrameProtocol(client=False, extensions=[])
+
+
 class WebsocketClosedError(Exception):
     pass
 
 
+def frame(data) -> bytes:
+    """Frame `data`, text or bytes, as a complete server message.
+    """
+    return bytes(_framer.send_data(data, fin=True))
+
+
+class Deflate(PerMessageDeflate):
+    """permessage-deflate, leaving the messages under `min_size` bytes
+    uncompressed: they would barely shrink, for the price of a zlib call.
+    """
+
+    def __init__(self, min_size: int=256, **params):
+        super().__init__(**params)
+        self.min_size = min_size
+
+    def frame_outbound(self, proto, opcode, rsv, data, fin):
+        if fin and opcode in (Opcode.TEXT, Opcode.BINARY) \
+           and len(data) < self.min_size:
+            # A single frame message: sent as is, RSV1 unset.
+            return rsv, data
+        return super().frame_outbound(proto, opcode, rsv, data, fin)
+
+
+class MessageQueue:
+    """FIFO queue of websocket events, bounded to `maxsize` for `put`.
+
+    `push` ignores the bound: it is meant for the control frames and
+    for the overflow policies, which decide themselves what to keep.
+    Once closed, `put` raises `WebsocketClosedError`, waking up the
+    writers waiting for room.
+    """
+
+    __slots__ = (
+        'items', 'maxsize', 'readable', 'writable', 'peak', 'dropped',
+        'closed')
+
+    def __init__(self, maxsize: int=0):
+        self.items = deque()
+        self.maxsize = maxsize
+        self.readable = Event()
+        self.writable = Event()
+        self.peak = 0
+        self.dropped = 0
+        self.closed = False
+
+    def __len__(self):
+        return len(self.items)
+
+    def empty(self) -> bool:
+        return not self.items
+
+    def full(self) -> bool:
+        return 0 < self.maxsize <= len(self.items)
+
+    async def push(self, item):
+        self.items.append(item)
+        if len(self.items) > self.peak:
+            self.peak = len(self.items)
+        if not self.readable.is_set():
+            await self.readable.set()
+
+    async def put(self, item):
+        while self.full() and not self.closed:
+            self.writable.clear()
+            await self.writable.wait()
+        if self.closed:
+            raise WebsocketClosedError()
+        await self.push(item)
+
+    async def close(self):
+        self.closed = True
+        if not self.writable.is_set():
+            await self.writable.set()
+
+    async def drain(self) -> list:
+        items = list(self.items)
+        self.items.clear()
+        if not self.writable.is_set():
+            await self.writable.set()
+        return items
+
+    def drop_oldest(self):
+        self.items.popleft()
+        self.dropped += 1
+
+    async def get(self):
+        while not self.items:
+            self.readable.clear()
+            await self.readable.wait()
+        item = self.items.popleft()
+        if not self.writable.is_set():
+            await self.writable.set()
+        return item
+
+    async def __aiter__(self):
+        while True:
+            yield await self.get()
+
+
+class MessageStream(MessageQueue):
+    """The fragments of a message, as they arrive.
+
+    Iterating stops at the end of the message and raises
+    `WebsocketClosedError` if the connection closed before it.
+    Its bound holds the reading: a slow consumer slows the peer down.
+    A stream left for the next message is discarded: the rest of its
+    fragments are read and thrown away.
+    """
+
+    __slots__ = ()
+
+    async def discard(self):
+        self.items.clear()
+        await self.push(CLOSED)
+        await self.close()
+
+    async def __aiter__(self):
+        while True:
+            chunk = await self.get()
+            if chunk is None:
+                break
+            if chunk is CLOSED:
+                raise WebsocketClosedError()
+            yield chunk
+
+
+class Topics:
+    """Index of the websockets subscribed to named topics.
+
+    Both directions are indexed: publishing only looks at a topic's
+    subscribers and a closing websocket leaves all its topics at once.
+    """
+
+    __slots__ = ('subscribers', 'subscriptions')
+
+    def __init__(self):
+        self.subscribers = {}
+        self.subscriptions = {}
+
+    def subscribe(self, websocket, topic: str):
+        self.subscribers.setdefault(topic, set()).add(websocket)
+        self.subscriptions.setdefault(websocket, set()).add(topic)
+
+    def unsubscribe(self, websocket, topic: str):
+        subscribers = self.subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(websocket)
+            if not subscribers:
+                del self.subscribers[topic]
+        topics = self.subscriptions.get(websocket)
+        if topics is not None:
+            topics.discard(topic)
+            if not topics:
+                del self.subscriptions[websocket]
+
+    def discard(self, websocket):
+        for topic in self.subscriptions.pop(websocket, ()):
+            subscribers = self.subscribers[topic]
+            subscribers.discard(websocket)
+            if not subscribers:
+                del self.subscribers[topic]
+
+    def get(self, topic: str) -> set:
+        return self.subscribers.get(topic, frozenset())
+
+    def __contains__(self, topic: str):
+        return topic in self.subscribers
+
+    def __len__(self):
+        return len(self.subscribers)
+
+
+class Keepalive:
+    """Pings the silent websockets and evicts the stale or idle ones.
+
+    A single task sweeps all the websockets every `resolution` seconds
+    instead of a timer per connection. A websocket that sent nothing
+    for `interval` seconds is pinged; still silent `timeout` seconds
+    later, it is aborted. With `idle`, websockets that sent no message
+    for that long are closed, pongs notwithstanding.
+    """
+
+    __slots__ = (
+        'websockets', 'interval', 'timeout', 'idle', 'resolution',
+        'pinged', 'evicted')
+
+    STALE_CLOSE_CODE = 1011
+    IDLE_CLOSE_CODE = 1001
+
+    def __init__(self, websockets, interval: float=20.0,
+                 timeout: float=10.0, idle: float=None):
+        self.websockets = websockets
+        self.interval = interval
+        self.timeout = timeout
+        self.idle = idle
+        self.resolution = min(interval, timeout) / 2
+        self.pinged = 0
+        self.evicted = 0
+
+    async def sweep(self, now: float):
+        # A copy: the evicted websockets leave the registry meanwhile.
+        for ws in list(self.websockets):
+            if ws.closed:
+                continue
+            silent = now - ws.last_seen
+            if silent > self.interval + self.timeout:
+                self.evicted += 1
+                await ws.abort(self.STALE_CLOSE_CODE, 'Ping timeout.')
+            elif ws.protocol.state is not ConnectionState.OPEN:
+                # Closing handshake under way.
+                continue
+            elif self.idle is not None and \
+                    now - ws.last_message > self.idle:
+                self.evicted += 1
+                await ws.close(self.IDLE_CLOSE_CODE, 'Idle timeout.')
+            elif silent > self.interval and ws.pinged < ws.last_seen:
+                # Once per silence.
+                ws.pinged = now
+                self.pinged += 1
+                await ws.outgoing.push(_ping)
+
+    async def run(self):
+        while True:
+            await sleep(self.resolution)
+            await self.sweep(monotonic())
+
+
 class WebsocketPrototype(ABC):
+    """Websocket I/O over a socket, with its own reading and writing tasks.
+
+    The outgoing queue holds at most `MAX_OUTGOING` messages (0 for no
+    limit) for a peer that doesn't read fast enough. Past that, the
+    `OVERFLOW` policy applies: `BLOCK` the sender, `DROP_OLDEST` or
+    `DROP_NEWEST` message, or `DISCONNECT` the peer if the queue is still
+    full after `OVERFLOW_GRACE` seconds, dropping the newest meanwhile.
+    An aborted connection gets its close frame within `ABORT_TIMEOUT`
+    seconds, unless a write is under way: a frame can't be cut.
+
+    Fragmented messages are reassembled, unless `STREAMING` is set:
+    each message is then received as a `MessageStream` of its
+    fragments, as soon as the first one arrives. A message larger than
+    `MAX_MESSAGE` bytes, UTF-8 encoded for the text, closes the
+    connection with `TOO_BIG_CLOSE_CODE`. 0 lifts the limit: a peer can
+    then exhaust the memory with a single endless message, unless
+    streamed.
+
+    With `BATCH`, the messages queued during the scheduling tick of the
+    first one are written along with it, in a single `sendall`, up to
+    `BATCH_BYTES`. `BATCH_DELAY` seconds, if any, are allowed for more
+    messages to come.
+    """
 
     __slots__ = (
         'socket',
         'protocol',
         'outgoing',
-        'incoming',
+        '_incoming',
         'closure',
-        'closing'
+        'closing',
+        'overflowing_since',
+        'last_seen',
+        'last_message',
+        'pinged',
+        'partial',
+        'partial_size',
+        'streamed',
+        'writes',
+        'opened',
+        'bytes_in',
+        'bytes_out',
     )
 
+    BLOCK = 'block'
+    DROP_OLDEST = 'drop_oldest'
+    DROP_NEWEST = 'drop_newest'
+    DISCONNECT = 'disconnect'
+
+    MIN_READ = 4096
+    MAX_READ = 65536
+
+    MAX_OUTGOING = 0
+    OVERFLOW = BLOCK
+    OVERFLOW_GRACE = 5.0
+    OVERFLOW_CLOSE_CODE = 1008
+    ABORT_TIMEOUT = 1.0
+
+    STREAMING = False
+    STREAM_BUFFER = 16
+    MAX_MESSAGE = 1048576
+    TOO_BIG_CLOSE_CODE = 1009
+
+    BATCH = False
+    BATCH_BYTES = 65536
+    BATCH_DELAY = 0.0
+
     def __init__(self):
-        self.outgoing = Queue()
-        self.incoming = Queue()
+        self.outgoing = MessageQueue(self.MAX_OUTGOING)
+        self._incoming = None
         self.closure = None
         self.closing = Event()
+        self.overflowing_since = None
+        self.last_seen = self.last_message = monotonic()
+        self.pinged = 0.0
+        self.partial = None
+        self.partial_size = 0
+        self.streamed = None
+        self.writes = 0
+        self.opened = monotonic()
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @property
+    def incoming(self):
+        # Created on demand: push-only websockets never need it.
+        if self._incoming is None:
+            self._incoming = MessageQueue()
+            if self.closed:
+                # Closed before anyone listened: nothing else will come.
+                self._incoming.items.append(CLOSED)
+        return self._incoming
 
     @property
     def closed(self):
         return self.closing.is_set()
 
-    async def send(self, data):
+    def stats(self) -> dict:
+        return {
+            'queued': len(self.outgoing),
+            'peak': self.outgoing.peak,
+            'dropped': self.outgoing.dropped,
+        }
+
+    async def _enqueue(self, item, wait: bool=True):
         if self.closed:
             raise WebsocketClosedError()
-        await self.outgoing.put(Message(data=data))
+        outgoing = self.outgoing
+        if outgoing.full():
+            policy = self.OVERFLOW
+            if policy == self.BLOCK and wait:
+                return await outgoing.put(item)
+            elif policy == self.DROP_OLDEST:
+                outgoing.drop_oldest()
+            elif policy == self.DISCONNECT:
+                now = monotonic()
+                if self.overflowing_since is None:
+                    self.overflowing_since = now
+                elif now - self.overflowing_since > self.OVERFLOW_GRACE:
+                    await self.abort(
+                        self.OVERFLOW_CLOSE_CODE, 'Too slow a consumer.')
+                    raise WebsocketClosedError()
+                # The bound holds during the grace period.
+                outgoing.dropped += 1
+                return
+            else:
+                outgoing.dropped += 1
+                return
+        await outgoing.push(item)
+
+    async def send(self, data):
+        await self._enqueue(Message(data=data))
+
+    async def send_frame(self, frame: bytes):
+        """Send a message already framed by `frame`.
+
+        Meant for fan-outs, it never waits on a full queue: under the
+        `BLOCK` policy, the message is dropped instead.
+        """
+        await self._enqueue(frame, wait=False)
+
+    async def abort(self, code: int, reason: str):
+        """Close right away, without waiting for the peer's answer.
+        """
+        self.closure = CloseConnection(code=code, reason=reason)
+        await self._set_closed()
+        # Never to be sent.
+        self.outgoing.items.clear()
+        if self.protocol.state is ConnectionState.OPEN:
+            try:
+                await timeout_after(
+                    self.ABORT_TIMEOUT, self.socket.sendall,
+                    self.protocol.send(self.closure))
+            except (TaskTimeout, ResourceBusy, OSError):
+                # Stuck, or the writer is: the peer doesn't read.
+                pass
+        try:
+            await self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    async def _set_closed(self):
+        await self.closing.set()
+        # The senders blocked on a full queue.
+        await self.outgoing.close()
+        if self._incoming is not None:
+            await self._incoming.push(CLOSED)
+        if isinstance(self.partial, MessageStream):
+            # Truncated.
+            await self.partial.push(CLOSED)
+            await self.partial.close()
+        self.partial = None
+
+    async def _next(self):
+        if self.streamed is not None:
+            # Moving on: the reader must not wait for this one anymore.
+            await self.streamed.discard()
+            self.streamed = None
+        message = await self.incoming.get()
+        if isinstance(message, MessageStream):
+            self.streamed = message
+        return message
 
     async def recv(self):
         if not self.closed:
-            async with TaskGroup(wait=any) as g:
-                receiver = await g.spawn(self.incoming.get)
-                await g.spawn(self.closing.wait)
-            if g.completed is receiver:
-                return receiver.result
+            message = await self._next()
+            if message is not CLOSED:
+                return message
+            # Left for the other receivers, if any.
+            await self.incoming.push(CLOSED)
+
+    async def recv_many(self) -> list:
+        """All the messages received so far, waiting for one at least.
+        Empty once closed.
+        """
+        message = await self.recv()
+        if message is None:
+            return []
+        messages = [message]
+        for message in await self.incoming.drain():
+            if message is CLOSED:
+                await self.incoming.push(CLOSED)
+            else:
+                if isinstance(message, MessageStream):
+                    self.streamed = message
+                messages.append(message)
+        return messages
 
     async def __aiter__(self):
-        async for msg in self.incoming:
+        while True:
+            msg = await self._next()
+            if msg is CLOSED:
+                await self.incoming.push(CLOSED)
+                break
             yield msg
 
     async def close(self, code=1000, reason='Closed.'):
-        await self.outgoing.put(
+        await self.outgoing.push(
             CloseConnection(code=code, reason=reason))
 
+    async def _dispatch(self):
+        # A single read can hold many frames.
+        for event in self.protocol.events():
+            if isinstance(event, CloseConnection):
+                self.closure = event
+                await self.outgoing.push(event.response())
+                return await self._set_closed()
+            elif isinstance(event, Message):
+                self.last_message = self.last_seen
+                await self._receive(event)
+                if self.closed:
+                    return
+            elif isinstance(event, Ping):
+                await self.outgoing.push(event.response())
+
+    async def _receive(self, event: Message):
+        data = event.data
+        if isinstance(data, str) and not data.isascii():
+            # The limit is in bytes, as received.
+            self.partial_size += len(data.encode())
+        else:
+            self.partial_size += len(data)
+        if self.MAX_MESSAGE and self.partial_size > self.MAX_MESSAGE:
+            self.closure = CloseConnection(
+                code=self.TOO_BIG_CLOSE_CODE, reason='Message too big.')
+            await self.outgoing.push(self.closure)
+            return await self._set_closed()
+
+        if self.STREAMING:
+            stream = self.partial
+            if stream is None:
+                stream = self.partial = MessageStream(self.STREAM_BUFFER)
+                await self.incoming.push(stream)
+            if not stream.closed:
+                try:
+                    await stream.put(event.data)
+                    if event.message_finished:
+                        await stream.push(None)
+                except WebsocketClosedError:
+                    # Discarded meanwhile, or the connection closed.
+                    pass
+        elif not event.message_finished:
+            if self.partial is None:
+                self.partial = []
+            self.partial.append(event.data)
+            return
+        elif self.partial is None:
+            # Unfragmented: the usual case.
+            await self.incoming.push(event.data)
+        else:
+            self.partial.append(event.data)
+            empty = '' if isinstance(event.data, str) else b''
+            await self.incoming.push(empty.join(self.partial))
+
+        if event.message_finished:
+            self.partial = None
+            self.partial_size = 0
+
     async def _handle_incoming(self):
-        events = self.protocol.events()
+        size = self.MIN_READ
+        # Frames may have come along with the handshake.
+        await self._dispatch()
         while not self.closed:
             try:
-                data = await self.socket.recv(4096)
+                data = await self.socket.recv(size)
             except ConnectionResetError:
-                return await self.closing.set()
+                return await self._set_closed()
 
-            self.protocol.receive_data(data)
-            try:
-                event = next(events)
-            except StopIteration:
+            if not data:
                 # Connection dropped unexpectedly
-                return await self.closing.set()
+                return await self._set_closed()
 
-            if isinstance(event, CloseConnection):
-                self.closure = event
-                await self.outgoing.put(event.response())
-                await self.closing.set()
+            # Pongs included: anything proves the peer is alive.
+            self.last_seen = monotonic()
+            self.bytes_in += len(data)
+
+            # Follow the pace of the peer: bursts get larger reads.
+            if len(data) == size and size < self.MAX_READ:
+                size *= 2
+            elif len(data) < size // 4 and size > self.MIN_READ:
+                size //= 2
+
+            self.protocol.receive_data(data)
+            await self._dispatch()
+
+    async def _gather(self, data: bytes) -> bytes:
+        # Data frames only: control frames and the end of the flow
+        # are left to `_handle_outgoing`.
+        batch = [data]
+        size = len(data)
+        items = self.outgoing.items
+        # Let the current tick queue its messages.
+        await sleep(0)
+        deadline = monotonic() + self.BATCH_DELAY
+        while size < self.BATCH_BYTES:
+            if not items:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                self.outgoing.readable.clear()
+                await ignore_after(remaining, self.outgoing.readable.wait)
+                continue
+            event = items[0]
+            if isinstance(event, bytes):
+                await self.outgoing.get()
+                if self.protocol.state is ConnectionState.OPEN:
+                    batch.append(event)
+                    size += len(event)
             elif isinstance(event, Message):
-                await self.incoming.put(event.data)
-            elif isinstance(event, Ping):
-                await self.outgoing.put(event.response())
+                await self.outgoing.get()
+                data = self.protocol.send(event)
+                batch.append(data)
+                size += len(data)
+            else:
+                break
+        return b''.join(batch)
 
     async def _handle_outgoing(self):
         async for event in self.outgoing:
 
+            if self.overflowing_since is not None and \
+               not self.outgoing.full():
+                self.overflowing_since = None
+
             if event is None or self.protocol.state is ConnectionState.CLOSED:
-                return await self.closing.set()
+                return await self._set_closed()
 
-            data = self.protocol.send(event)
+            if isinstance(event, bytes):
+                if self.protocol.state is not ConnectionState.OPEN:
+                    # Closing: no more data frames.
+                    continue
+                data = event
+            elif isinstance(event, CloseConnection) and \
+                    self.protocol.state is ConnectionState.LOCAL_CLOSING:
+                # Already sent, by `abort` or an earlier `close`.
+                return await self._set_closed()
+            else:
+                data = self.protocol.send(event)
+            if self.BATCH and isinstance(event, (bytes, Message)):
+                data = await self._gather(data)
             try:
                 await self.socket.sendall(data)
+                self.writes += 1
+                self.bytes_out += len(data)
                 if isinstance(data, CloseConnection):
                     self.closure = event
-                    return await self.closing.set()
+                    return await self._set_closed()
             except socket.error:
-                return await self.closing.set()
+                return await self._set_closed()
 
     async def flow(self, *tasks):
         async with TaskGroup(tasks=tasks) as ws:
@@ -100,7 +635,7 @@ class WebsocketPrototype(ABC):
             finished = await ws.next_done()
 
             if finished is incoming:
-                await self.outgoing.put(None)
+                await self.outgoing.push(None)
                 await outgoing.join()
             elif finished in tasks:
                 # Task is finished.
@@ -114,11 +649,17 @@ class WebsocketPrototype(ABC):
 
 class Websocket(WebsocketPrototype):
     """Server-side websocket running a handler parallel to the I/O.
+
+    `deflate` holds the `Deflate` parameters if the compression is to be
+    negotiated: `min_size`, `server_max_window_bits`,
+    `client_max_window_bits`, `server_no_context_takeover` and
+    `client_no_context_takeover`.
     """
-    def __init__(self, socket):
+    def __init__(self, socket, deflate: dict=None):
         super().__init__()
         self.socket = socket
         self.protocol = WSConnection(ConnectionType.SERVER)
+        self.deflate = deflate
 
     async def upgrade(self, request):
         data = '{} {} HTTP/1.1\r\n'.format(
@@ -137,5 +678,9 @@ class Websocket(WebsocketPrototype):
             event = next(self.protocol.events())
             if not isinstance(event, Request):
                 raise HTTPError(HTTPStatus.BAD_REQUEST)
-            data = self.protocol.send(AcceptConnection())
+            extensions = []
+            if self.deflate is not None:
+                # Only enabled if the client offered it.
+                extensions.append(Deflate(**self.deflate))
+            data = self.protocol.send(AcceptConnection(extensions=extensions))
             await self.socket.sendall(data)
@@ -0,0 +1,126 @@
+import os
+import curio
+from time import monotonic
+from functools import partial
+from curio.workers import ThreadWorker, ProcessWorker, WorkerPool
+from trinket.http import HTTPStatus, HTTPError
+
+
+_exhausted = object()
+
+
+class ThreadPool:
+    """Worker threads of our own, `size` of them at most.
+
+    Callers queue on a semaphore, first-in first-out, so a burst of
+    blocking work cannot starve the calls that came before it.
+    The time spent queueing is accumulated and exposed by `stats`.
+    When `backlog` callers are already queued, a 503 is raised
+    instead of queueing one more. The workers are started on demand
+    and kept alive until `shutdown`.
+    """
+
+    __slots__ = (
+        'size', 'backlog', 'slots', 'workers', 'waiting', 'calls',
+        'rejected', 'wait_total', 'wait_max')
+
+    # Not curio's shared pools: they are capped below `size`.
+    worker = ThreadWorker
+
+    def __init__(self, size: int=16, backlog: int=None):
+        self.size = size
+        self.backlog = backlog
+        self.slots = curio.Semaphore(size)
+        self.workers = WorkerPool(self.worker, size)
+        self.waiting = 0
+        self.calls = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def acquire(self):
+        if self.backlog is not None and self.slots.locked() \
+           and self.waiting >= self.backlog:
+            self.rejected += 1
+            raise HTTPError(
+                HTTPStatus.SERVICE_UNAVAILABLE, 'Workers are saturated.')
+        queued = monotonic()
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        waited = monotonic() - queued
+        self.calls += 1
+        self.wait_total += waited
+        if waited > self.wait_max:
+            self.wait_max = waited
+        return waited
+
+    async def release(self):
+        await self.slots.release()
+
+    async def execute(self, func, *args):
+        worker = await self.workers.reserve()
+        try:
+            return await worker.apply(func, args)
+        finally:
+            await worker.release()
+
+    def shutdown(self):
+        self.workers.shutdown()
+
+    async def run(self, func, *args, **kwargs):
+        await self.acquire()
+        try:
+            if kwargs:
+                func = partial(func, **kwargs)
+            return await self.execute(func, *args)
+        finally:
+            await self.release()
+
+    @property
+    def busy(self) -> int:
+        return self.size - self.slots.value
+
+    def stats(self) -> dict:
+        return {
+            'size': self.size,
+            'busy': self.busy,
+            'waiting': self.waiting,
+            'calls': self.calls,
+            'rejected': self.rejected,
+            'wait_total': self.wait_total,
+            'wait_max': self.wait_max,
+        }
+
+
+class ProcessPool(ThreadPool):
+    """Worker processes of our own, for CPU-bound work.
+
+    Arguments and results cross the process boundary pickled:
+    the callable must be importable and the result must not hold
+    a stream.
+    """
+
+    __slots__ = ()
+
+    worker = ProcessWorker
+
+    def __init__(self, size: int=None, backlog: int=None):
+        super().__init__(size or os.cpu_count() or 1, backlog)
+
+
+async def iterate(iterable, pool: ThreadPool=None):
+    """Consume a synchronous iterable without blocking the kernel.
+
+    Each step is a separate call: concurrent streams interleave
+    in the pool instead of holding a thread for their whole length.
+    """
+    run = pool.run if pool is not None else curio.run_in_thread
+    iterator = iter(iterable)
+    while True:
+        chunk = await run(next, iterator, _exhausted)
+        if chunk is _exhausted:
+            break
+        yield chunk
@@ -2,12 +2,15 @@ import inspect
 import pytest
 
 from curio import Kernel
-from curio.debug import longblock, logcrash
+from curio.debug import logcrash
 from curio.monitor import Monitor
+from trinket.monitor import blocking
 
 
 MARKER = 'curio'
 
+pytest_plugins = 'pytester'
+
 
 @pytest.mark.tryfirst
 def pytest_pycollect_makeitem(collector, name, obj):
@@ -38,7 +41,7 @@ def pytest_runtest_setup(item):
 
 @pytest.fixture
 def kernel(request):
-    k = Kernel(debug=[longblock, logcrash])
+    k = Kernel(debug=[blocking, logcrash])
     m = Monitor(k)
     request.addfinalizer(lambda: k.run(shutdown=True))
     request.addfinalizer(m.close)
@@ -0,0 +1,77 @@
+import io
+import pytest
+import curio
+from trinket import Response, HTTPError
+from trinket.access import AccessLog
+from trinket.extensions import access_log
+
+
+def test_ring_buffer():
+    records = AccessLog(size=3)
+    for index in range(5):
+        records.record('GET', f'/{index}', 200, 10, 0.001)
+    assert len(records) == 3
+    assert records.dropped == 2
+    assert [record[2] for record in records.take()] == ['/0', '/1', '/2']
+    assert len(records) == 0
+
+    records.record('GET', '/5', 404, 0, 0.002)
+    records.record('GET', '/6', 200, 0, 0.002)
+    batch = records.take()
+    assert [record[2] for record in batch] == ['/5', '/6']
+
+    lines = records.format(batch).splitlines()
+    assert lines[0].endswith('Z GET /5 404 0 2.000ms')
+    assert lines[2] == '# 2 records dropped'
+    assert '# ' not in records.format([])
+
+
+@pytest.mark.curio
+async def test_access_log(app, client):
+    stream = io.StringIO()
+    access_log(app, stream=stream, interval=0.01)
+
+    @app.route('/hello')
+    async def hello(request):
+        return Response.raw(b'Hello.')
+
+    @app.route('/fail')
+    async def fail(request):
+        raise HTTPError(503)
+
+    async with client:
+        async with client.query('GET', '/hello') as response:
+            assert response.status == 200
+        async with client.query('GET', '/fail') as response:
+            assert response.status == 503
+        await curio.sleep(0.05)
+        lines = stream.getvalue().splitlines()
+        assert len(lines) == 2
+        assert ' GET /hello 200 6 ' in lines[0]
+        assert ' GET /fail 503 19 ' in lines[1]
+
+
+@pytest.mark.curio
+async def test_access_log_shutdown_before_startup(app, tmp_path):
+    access_log(app, path=str(tmp_path / 'access.log'))
+    await app.notify('shutdown')
+
+
+@pytest.mark.curio
+async def test_access_log_sampling_and_file(app, client, tmp_path):
+    path = tmp_path / 'access.log'
+    access_log(app, path=str(path), rate=0.0, interval=10)
+
+    @app.route('/hello')
+    async def hello(request):
+        return Response.raw(b'Hello.')
+
+    access_log(app, path=str(path), rate=1.0, interval=10)
+
+    async with client:
+        async with client.query('GET', '/hello') as response:
+            assert response.status == 200
+        await app.notify('shutdown')
+
+    # Flushed on shutdown, once: the other log sampled it out.
+    assert path.read_text().count(' GET /hello 200 ') == 1
@@ -0,0 +1,146 @@
+import json
+import pytest
+from trinket.bench import (
+    SCENARIOS, broadcast, load, main, percentile, report, run)
+from trinket.testing import Baseline
+
+
+def test_percentile():
+    latencies = [float(value) for value in range(1, 1001)]
+    assert percentile(latencies, 0.5) == 500.0
+    assert percentile(latencies, 0.99) == 990.0
+    assert percentile(latencies, 0.999) == 999.0
+    assert percentile([], 0.5) == 0.0
+
+
+def test_report():
+    result = report([0.3, 0.1, 0.2], 2.0, errors=1, connections=2)
+    assert result['requests'] == 3
+    assert result['errors'] == 1
+    assert result['throughput'] == 1.5
+    assert result['p50'] == 0.2
+    assert result['connections'] == 2
+
+
+@pytest.mark.curio
+@pytest.mark.parametrize('pipeline', [1, 4])
+async def test_load(app, client, pipeline):
+    request = SCENARIOS['hello'](app)
+    async with client:
+        result = await load(client.server.sockaddr, request,
+                            connections=3, requests=40, pipeline=pipeline)
+    assert result['requests'] == 40
+    assert result['errors'] == 0
+    assert 0 < result['p50'] <= result['p99'] <= result['p999']
+
+
+@pytest.mark.curio
+async def test_load_counts_errors(app, client):
+    SCENARIOS['hello'](app)
+    async with client:
+        result = await load(
+            client.server.sockaddr,
+            b'GET /missing HTTP/1.1\r\n\r\n', connections=2, requests=10)
+    # The server closes the connection after an error: the requests
+    # sent meanwhile are lost, and counted as errors too.
+    assert result['errors'] == 10
+
+
+@pytest.mark.curio
+async def test_upload(app, client):
+    request = SCENARIOS['upload'](app)
+    async with client:
+        result = await load(client.server.sockaddr, request,
+                            connections=2, requests=10, pipeline=2)
+    assert result['errors'] == 0
+
+
+@pytest.mark.curio
+async def test_fanout(app, client):
+    path = SCENARIOS['fanout'](app)
+    async with client:
+        result = await broadcast(
+            client.server.sockaddr, path.split(':', 1)[1],
+            connections=3, messages=10)
+    # Each message reached every websocket.
+    assert result['requests'] == 30
+
+
+def test_run():
+    result = run('json', connections=2, requests=20)
+    assert result['scenario'] == 'json'
+    assert result['requests'] == 20
+    assert result['errors'] == 0
+
+
+def test_main(tmp_path):
+    output = tmp_path / 'results.json'
+    main(['streaming', '-c', '2', '-n', '10', '-o', str(output)])
+    results = json.loads(output.read_text())
+    assert [result['scenario'] for result in results] == ['streaming']
+
+
+def test_main_unknown_scenario():
+    with pytest.raises(SystemExit):
+        main(['nothing'])
+
+
+def test_baseline(tmp_path):
+    path = str(tmp_path / 'baseline.json')
+    baseline = Baseline(path, tolerance=0.1)
+    baseline.check('hello', {'throughput': 1000.0})
+    baseline.save()
+    assert json.loads(open(path).read()) == {'hello': 1000.0}
+
+    baseline = Baseline(path, tolerance=0.1)
+    baseline.check('hello', {'throughput': 950.0})
+    with pytest.raises(pytest.fail.Exception) as failure:
+        baseline.check('hello', {'throughput': 800.0})
+    assert '20% below the baseline of 1,000 req/s' in str(failure.value)
+    baseline.check('hello', {'throughput': 800.0}, tolerance=0.25)
+    assert not baseline.changed
+
+
+def test_baseline_update(tmp_path):
+    path = str(tmp_path / 'baseline.json')
+    baseline = Baseline(path)
+    baseline.check('hello', {'throughput': 1000.0})
+    baseline.save()
+    baseline = Baseline(path, update=True)
+    baseline.check('hello', {'throughput': 500.0})
+    baseline.save()
+    assert Baseline(path).throughputs == {'hello': 500.0}
+
+
+BASELINE_TEST = """
+from trinket.bench import run
+
+def test_hello(bench_baseline):
+    bench_baseline.check('hello', run('hello', connections=2, requests=200))
+"""
+
+
+def test_bench_baseline_fixture(testdir):
+    testdir.makepyfile(BASELINE_TEST)
+    baseline = testdir.tmpdir.join('bench-baseline.json')
+
+    # Recorded at teardown, when missing.
+    testdir.runpytest().assert_outcomes(passed=1)
+    measured = json.loads(baseline.read())['hello']
+    assert measured > 0
+
+    baseline.write(json.dumps({'hello': measured * 1000}))
+    result = testdir.runpytest()
+    result.assert_outcomes(failed=1)
+    result.stdout.fnmatch_lines(['*hello: * below the baseline of *'])
+    # Failures don't touch it.
+    assert json.loads(baseline.read()) == {'hello': measured * 1000}
+
+    testdir.runpytest('--bench-tolerance', '1').assert_outcomes(passed=1)
+
+    testdir.runpytest('--bench-update').assert_outcomes(passed=1)
+    assert json.loads(baseline.read())['hello'] < measured * 1000
+
+    testdir.runpytest('--bench-baseline', 'other.json').assert_outcomes(
+        passed=1)
+    assert 'hello' in json.loads(testdir.tmpdir.join('other.json').read())
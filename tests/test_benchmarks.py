@@ -0,0 +1,52 @@
+import pytest
+from trinket import Trinket, Request, Response
+from trinket.benchmarks import (
+    allocations, measure, run, selected, synchronously)
+
+
+def test_synchronously():
+    app = Trinket()
+
+    @app.route('/hello/{name}')
+    async def hello(request, name):
+        return Response.raw(name)
+
+    request = Request(None, None)
+    request.method = 'GET'
+    request.path = '/hello/you'
+    handler, params = synchronously(app.lookup(request))
+    assert params == {'name': 'you'}
+
+
+def test_synchronously_suspending():
+    from curio import sleep
+
+    with pytest.raises(RuntimeError):
+        synchronously(sleep(0))
+
+
+def test_measure():
+    result = measure(lambda: None, min_time=0.005)
+    assert result['ops'] > 0
+    assert result['mean_ns'] == pytest.approx(1e9 / result['ops'])
+
+
+def test_allocations():
+    kept = []
+    result = allocations(lambda: kept.append(bytearray(100000)))
+    assert result['peak_bytes'] >= 100000
+    assert result['retained_bytes'] >= 100000
+
+
+def test_selected():
+    assert selected('lookup.10', 'lookup.10')
+    assert selected('lookup.10', 'lookup')
+    assert not selected('lookup.100', 'lookup.10')
+    assert not selected('lookups', 'lookup')
+
+
+def test_run():
+    results = run(['lookup.10'], min_time=0.005)
+    assert list(results['benchmarks']) == ['lookup.10']
+    assert results['benchmarks']['lookup.10'].keys() == {
+        'ops', 'mean_ns', 'peak_bytes', 'retained_bytes'}
@@ -0,0 +1,82 @@
+import pytest
+import curio
+from trinket import Trinket
+from trinket.broker import LocalBroker, encode, decode
+from trinket.extensions import pubsub
+from trinket.server import Server
+from trinket.testing import LiveClient
+
+
+def test_encoding_roundtrip():
+    payload = encode('news', 'text') + encode(None, b'\x00binary')
+    assert list(decode(payload)) == [('news', 'text'), (None, b'\x00binary')]
+
+
+@pytest.mark.curio
+async def test_local_broker_batches_per_tick(tmp_path):
+    received = []
+
+    async def deliver(topic, data):
+        received.append((topic, data))
+
+    async def ignore(topic, data):
+        raise AssertionError('A worker never receives its own messages.')
+
+    first = LocalBroker(str(tmp_path), name='first')
+    second = LocalBroker(str(tmp_path), name='second')
+    third = LocalBroker(str(tmp_path), name='third')
+    await first.start(ignore)
+    await second.start(deliver)
+    await third.start(deliver)
+    try:
+        for index in range(10):
+            await first.publish('news', f'Message {index}')
+        await first.publish(None, b'To everyone')
+        await curio.sleep(0.05)
+    finally:
+        for broker in (first, second, third):
+            await broker.stop()
+
+    # One datagram per worker for the whole tick.
+    assert first.sent == 2
+    assert second.received == third.received == 1
+    assert len(received) == 22
+    assert received[:11] == [
+        ('news', f'Message {index}') for index in range(10)] + [
+        (None, b'To everyone')]
+
+
+def test_large_batches_are_split(tmp_path):
+    broker = LocalBroker(str(tmp_path))
+    batch = [('topic', b'x' * 40000)] * 3
+    datagrams = list(broker.datagrams(batch))
+    assert len(datagrams) == 3
+    assert [data for _, data in decode(b''.join(datagrams))] == [
+        b'x' * 40000] * 3
+
+
+@pytest.mark.curio
+async def test_publish_across_apps(tmp_path):
+
+    def make_app(name):
+        app = pubsub(Trinket(), LocalBroker(str(tmp_path), name=name))
+
+        @app.websocket('/room/{topic}')
+        async def room(request, ws, topic, **params):
+            app.topics.subscribe(ws, topic)
+            while True:
+                data = await ws.recv()
+                if data is None:
+                    break
+                await app.publish(topic, data)
+
+        return LiveClient(Server('', 0), app)
+
+    here, there = make_app('here'), make_app('there')
+    async with here, there:
+        async with here.websocket('/room/lobby') as sender:
+            async with there.websocket('/room/lobby') as listener:
+                await curio.sleep(0.01)
+                await sender.send('Hello from here.')
+                assert await sender.recv() == 'Hello from here.'
+                assert await listener.recv() == 'Hello from here.'
@@ -0,0 +1,88 @@
+import pytest
+import curio
+from trinket import Response, HTTPError
+
+
+pytestmark = pytest.mark.curio
+
+UPLOAD = (
+    b'POST /upload HTTP/1.1\r\n'
+    b'Host: localhost\r\n'
+    b'Content-Length: 5\r\n'
+    b'Expect: 100-continue\r\n'
+    b'\r\n')
+
+
+async def connect(client):
+    sock = curio.socket.socket(curio.socket.AF_INET, curio.socket.SOCK_STREAM)
+    await sock.connect(client.server.sockaddr)
+    return sock
+
+
+async def test_continue_is_sent_when_the_body_is_read(app, client):
+
+    @app.route('/upload', methods=['POST'])
+    async def upload(request):
+        return Response.raw(await request.raw_body)
+
+    async with client:
+        sock = await connect(client)
+        async with sock:
+            await sock.sendall(UPLOAD)
+            assert await sock.recv(1024) == b'HTTP/1.1 100 Continue\r\n\r\n'
+            await sock.sendall(b'12345')
+            response = await sock.recv(1024)
+    assert response.startswith(b'HTTP/1.1 200 OK\r\n')
+    assert response.endswith(b'\r\n\r\n12345')
+
+
+async def test_pre_body_refusal_skips_the_body(app, client):
+
+    @app.route('/upload', methods=['POST'])
+    async def upload(request):
+        raise AssertionError('Never reached.')
+
+    @app.listen('pre_body')
+    async def authorize(request):
+        if 'Authorization' not in request.headers:
+            raise HTTPError(401)
+
+    async with client:
+        sock = await connect(client)
+        async with sock:
+            await sock.sendall(UPLOAD)
+            response = await sock.recv(1024)
+            assert response.startswith(b'HTTP/1.1 401 Unauthorized\r\n')
+            # The connection is closed: the body was never invited.
+            assert await sock.recv(1024) == b''
+
+
+async def test_ignored_body_closes_the_connection(app, client):
+
+    @app.route('/upload', methods=['POST'])
+    async def upload(request):
+        return Response.raw(b'Ignored.')
+
+    async with client:
+        sock = await connect(client)
+        async with sock:
+            await sock.sendall(UPLOAD)
+            response = await sock.recv(1024)
+            assert response.startswith(b'HTTP/1.1 200 OK\r\n')
+            assert b'Connection: close\r\n' in response
+            assert await sock.recv(1024) == b''
+
+
+async def test_pre_body_hook_can_answer(app, client):
+
+    @app.route('/upload', methods=['POST'])
+    async def upload(request):
+        raise AssertionError('Never reached.')
+
+    @app.listen('pre_body')
+    async def quota(request):
+        return Response(413)
+
+    async with client:
+        async with client.query('POST', '/upload', body=b'data') as response:
+            assert response.status == 413
@@ -0,0 +1,85 @@
+import gc
+import tracemalloc
+import pytest
+import curio
+from trinket.request import Channel
+from trinket import Response
+from trinket.testing import RequestForger, Websocket
+
+
+pytestmark = pytest.mark.curio
+
+CONNECTIONS = 200
+
+
+def server_side(snapshot):
+    # The client sockets are allocated here, in the test module.
+    return snapshot.filter_traces(
+        (tracemalloc.Filter(False, __file__),))
+
+
+async def measure(open_connection):
+    """Bytes held per idle connection, once the connections are up.
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = server_side(tracemalloc.take_snapshot())
+    connections = [await open_connection() for _ in range(CONNECTIONS)]
+    # Let the server settle into its idle state.
+    await curio.sleep(0.1)
+    gc.collect()
+    after = server_side(tracemalloc.take_snapshot())
+    tracemalloc.stop()
+    for connection in connections:
+        await connection.close()
+    grown = sum(
+        stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return grown / CONNECTIONS
+
+
+async def test_idle_keep_alive_footprint(app, client, record_property):
+
+    class LeanChannel(Channel):
+        RELEASE_IDLE = True
+
+    app.channel = LeanChannel
+
+    @app.route('/')
+    async def hello(request):
+        return Response.raw(b'Hello.')
+
+    request = RequestForger.forge(
+        'GET', '/', b'', headers={'Connection': 'keep-alive'})
+
+    async with client:
+
+        async def open_connection():
+            sock = curio.socket.socket(
+                curio.socket.AF_INET, curio.socket.SOCK_STREAM)
+            await sock.connect(client.server.sockaddr)
+            await sock.sendall(request)
+            return sock
+
+        per_connection = await measure(open_connection)
+
+    record_property('bytes_per_idle_connection', per_connection)
+    assert per_connection < 16384
+
+
+async def test_idle_websocket_footprint(app, client, record_property):
+
+    @app.websocket('/push')
+    async def push(request, ws, **params):
+        await ws.closing.wait()
+
+    async with client:
+
+        async def open_connection():
+            ws = Websocket()
+            await ws.connect('/push', *client.server.sockaddr)
+            return ws.socket
+
+        per_connection = await measure(open_connection)
+
+    record_property('bytes_per_idle_websocket', per_connection)
+    assert per_connection < 65536
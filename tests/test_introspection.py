@@ -0,0 +1,75 @@
+import json
+import pytest
+import curio
+from trinket import Response
+from trinket import introspection
+from trinket.extensions import introspect
+from trinket.testing import RequestForger
+
+
+pytestmark = pytest.mark.curio
+
+
+async def test_connections(app, client):
+    introspect(app)
+
+    @app.route('/hello')
+    async def hello(request):
+        return Response.raw(b'Hello.')
+
+    @app.websocket('/feed')
+    async def feed(request, ws, **params):
+        await ws.send('Welcome.')
+        await ws.closing.wait()
+
+    async with client:
+        sock = curio.socket.socket(
+            curio.socket.AF_INET, curio.socket.SOCK_STREAM)
+        await sock.connect(client.server.sockaddr)
+        async with sock:
+            await sock.sendall(RequestForger.forge(
+                'GET', '/hello', b'', headers={'Connection': 'keep-alive'}))
+            assert (await sock.recv(1024)).endswith(b'Hello.')
+
+            async with client.websocket('/feed') as ws:
+                assert await ws.recv() == 'Welcome.'
+                async with client.query(
+                        'GET', '/_admin/connections') as response:
+                    assert response.status == 200
+                    report = json.loads(
+                        await curio.run_in_thread(response.read))
+
+    states = {connection['state']: connection
+              for connection in report['connections']}
+    assert set(states) == {'idle', 'websocket', 'handler'}
+
+    idle = states['idle']
+    assert idle['served'] == 1
+    assert idle['bytes_in'] > 0
+    assert idle['bytes_out'] > len(b'Hello.')
+    assert idle['peer'].startswith('127.0.0.1:')
+
+    assert states['handler']['route'] == '/_admin/connections'
+    assert states['handler']['served'] == 0
+
+    websocket = states['websocket']
+    assert websocket['route'] == '/feed'
+    assert websocket['websocket']['bytes_out'] > len('Welcome.')
+
+    assert report['websockets']['open'] == 1
+    assert report['tasks']['total'] > 3
+    assert report['threads']['size'] == 16
+
+
+async def test_forbidden(app, client):
+    introspect(app, authorize=lambda request: False)
+
+    async with client:
+        async with client.query('GET', '/_admin/connections') as response:
+            assert response.status == 403
+
+
+async def test_tasks_without_the_kernel_internals(monkeypatch):
+    assert (await introspection.tasks())['total'] >= 1
+    monkeypatch.setattr(introspection, '_get_kernel', None)
+    assert await introspection.tasks() == {'total': None, 'states': {}}
@@ -0,0 +1,131 @@
+import pytest
+import curio
+from trinket import Response
+from trinket.testing import RequestForger
+
+
+pytestmark = pytest.mark.curio
+
+
+async def connect(client):
+    sock = curio.socket.socket(curio.socket.AF_INET, curio.socket.SOCK_STREAM)
+    await sock.connect(client.server.sockaddr)
+    return sock
+
+
+async def test_small_unread_body_is_drained(app, client):
+
+    @app.route('/ignore', methods=['POST'])
+    async def ignore(request):
+        return Response.raw(b'Ignored.')
+
+    @app.route('/')
+    async def hello(request):
+        return Response.raw(b'Hello.')
+
+    upload = RequestForger.post('/ignore', body=b'x' * 2048)
+
+    async with client:
+        sock = await connect(client)
+        async with sock:
+            # Headers and the beginning of the body.
+            await sock.sendall(upload[:-1024])
+            response = await sock.recv(1024)
+            assert response.startswith(b'HTTP/1.1 200 OK\r\n')
+            assert b'Connection: close' not in response
+            await sock.sendall(upload[-1024:])
+            await sock.sendall(RequestForger.forge('GET', '/', b''))
+            response = await sock.recv(1024)
+            assert response.endswith(b'\r\n\r\nHello.')
+
+
+async def test_large_unread_body_closes_the_connection(app, client):
+
+    @app.route('/ignore', methods=['POST'])
+    async def ignore(request):
+        return Response.raw(b'Ignored.')
+
+    app.channel = type('Channel', (app.channel,), {'DRAIN_THRESHOLD': 1024})
+    upload = RequestForger.post('/ignore', body=b'x' * 4096)
+
+    async with client:
+        sock = await connect(client)
+        async with sock:
+            await sock.sendall(upload[:-2048])
+            response = await sock.recv(1024)
+            assert response.startswith(b'HTTP/1.1 200 OK\r\n')
+            assert b'Connection: close\r\n' in response
+            try:
+                assert await sock.recv(1024) == b''
+            except ConnectionResetError:
+                # Closing over unread bytes resets the connection.
+                pass
+
+
+async def test_request_following_a_drained_body(app, client):
+
+    @app.route('/ignore', methods=['POST'])
+    async def ignore(request):
+        return Response.raw(b'Ignored.')
+
+    @app.route('/')
+    async def hello(request):
+        return Response.raw(b'Hello.')
+
+    upload = RequestForger.post('/ignore', body=b'x' * 2048)
+
+    async with client:
+        sock = await connect(client)
+        async with sock:
+            await sock.sendall(upload[:-1024])
+            response = await sock.recv(1024)
+            assert response.endswith(b'\r\n\r\nIgnored.')
+            # The tail of the body and the next request, in one write.
+            await sock.sendall(
+                upload[-1024:] + RequestForger.forge('GET', '/', b''))
+            response = await curio.timeout_after(2, sock.recv(1024))
+            assert response.endswith(b'\r\n\r\nHello.')
+
+
+async def test_pipelined_requests(app, client):
+
+    @app.route('/echo', methods=['POST'])
+    async def echo(request):
+        return Response.raw(await request.raw_body)
+
+    @app.route('/{name}')
+    async def hello(request, name):
+        return Response.raw(f'Hello {name}.'.encode())
+
+    async with client:
+        sock = await connect(client)
+        async with sock:
+            await sock.sendall(
+                RequestForger.forge('GET', '/one', b'') +
+                RequestForger.post('/echo', body=b'two') +
+                RequestForger.forge('GET', '/three', b''))
+            received = b''
+            while received.count(b'HTTP/1.1 200 OK') < 3 or \
+                    not received.endswith(b'Hello three.'):
+                received += await curio.timeout_after(2, sock.recv(4096))
+            assert received.index(b'Hello one.') < \
+                received.index(b'\r\n\r\ntwo') < \
+                received.index(b'Hello three.')
+
+
+async def test_url_split_across_reads(app, client):
+
+    @app.route('/split/url')
+    async def split(request):
+        return Response.raw(request.query_string.encode())
+
+    request = RequestForger.forge('GET', '/split/url?key=value', b'')
+
+    async with client:
+        sock = await connect(client)
+        async with sock:
+            await sock.sendall(request[:10])
+            await curio.sleep(0.05)
+            await sock.sendall(request[10:])
+            response = await curio.timeout_after(2, sock.recv(1024))
+            assert response.endswith(b'\r\n\r\nkey=value')
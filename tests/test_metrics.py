@@ -0,0 +1,136 @@
+import pytest
+from trinket import Request, Response, HTTPError
+from trinket.extensions import metrics
+from trinket.metrics import STARTED, Metrics, render
+
+
+def observed(recorder, route, status, elapsed=0.0):
+    request = Request(None, None, **{'Content-Length': '10'})
+    request.route = route
+    recorder.start(request)
+    request[STARTED] -= elapsed
+    recorder.observe(request, status, 100)
+
+
+def test_render():
+    recorder = Metrics(bounds=(0.1, 1.0))
+    observed(recorder, '/hello/{name}', 200, 0.05)
+    observed(recorder, '/hello/{name}', 200, 0.5)
+    observed(recorder, '/hello/{name}', 500, 5)
+    observed(recorder, None, 404)
+    assert recorder.in_flight == 0
+
+    lines = render(recorder.snapshot(websockets=3)).splitlines()
+    assert 'trinket_requests_total{route="/hello/{name}",status="200"} 2' \
+        in lines
+    assert 'trinket_requests_total{route="/hello/{name}",status="500"} 1' \
+        in lines
+    assert 'trinket_requests_total{route="<unmatched>",status="404"} 1' \
+        in lines
+    assert [line for line in lines if line.startswith(
+        'trinket_request_duration_seconds_bucket{route="/hello/{name}"')
+    ] == [
+        'trinket_request_duration_seconds_bucket'
+        '{route="/hello/{name}",le="0.1"} 1',
+        'trinket_request_duration_seconds_bucket'
+        '{route="/hello/{name}",le="1.0"} 2',
+        'trinket_request_duration_seconds_bucket'
+        '{route="/hello/{name}",le="+Inf"} 3',
+    ]
+    assert 'trinket_request_duration_seconds_count{route="/hello/{name}"} 3' \
+        in lines
+    assert 'trinket_request_bytes_total{route="/hello/{name}"} 30' in lines
+    assert 'trinket_response_bytes_total{route="/hello/{name}"} 300' in lines
+    assert 'trinket_websockets 3' in lines
+
+
+def test_collect_merges_workers(tmp_path):
+    here = Metrics(str(tmp_path), name='here')
+    there = Metrics(str(tmp_path), name='there')
+    observed(here, '/', 200)
+    observed(there, '/', 200)
+    observed(there, '/', 404)
+    there.dump(there.snapshot(websockets=2))
+
+    merged = here.collect(here.snapshot(websockets=1))
+    assert merged['routes']['/']['statuses'] == {'200': 2, '404': 1}
+    assert sum(merged['routes']['/']['buckets']) == 3
+    assert merged['websockets'] == 3
+
+    there.discard()
+    merged = here.collect(here.snapshot())
+    assert merged['routes']['/']['statuses'] == {'200': 1}
+
+
+@pytest.mark.curio
+async def test_metrics_endpoint(app, client):
+    metrics(app, path='/_metrics')
+
+    @app.route('/hello/{name}')
+    async def hello(request, name):
+        return Response.raw(f'Hello {name}.'.encode())
+
+    @app.route('/fail')
+    async def fail(request):
+        raise HTTPError(503)
+
+    async with client:
+        for name in ('Alice', 'Bob'):
+            async with client.query('GET', f'/hello/{name}') as response:
+                assert response.status == 200
+        async with client.query('GET', '/nowhere') as response:
+            assert response.status == 404
+        async with client.query('GET', '/fail') as response:
+            assert response.status == 503
+        async with client.query('GET', '/_metrics') as response:
+            assert response.status == 200
+            assert response.getheader('Content-Type').startswith(
+                'text/plain; version=0.0.4')
+            lines = response.read().decode().splitlines()
+
+    assert 'trinket_requests_total{route="/hello/{name}",status="200"} 2' \
+        in lines
+    assert 'trinket_requests_total{route="<unmatched>",status="404"} 1' \
+        in lines
+    assert 'trinket_requests_total{route="/fail",status="503"} 1' in lines
+    assert 'trinket_response_bytes_total{route="/hello/{name}"} 22' in lines
+    # The scrape itself is still being handled.
+    assert 'trinket_requests_in_flight 1' in lines
+
+
+def test_finish_unobserved():
+    recorder = Metrics()
+    request = Request(None, None)
+    recorder.start(request)
+    assert recorder.in_flight == 1
+    assert list(request) == [STARTED]
+    recorder.finish(request)
+    assert recorder.in_flight == 0
+    assert not request
+    # Observed, then finished: counted once.
+    observed(recorder, '/', 200)
+    recorder.finish(request)
+    assert recorder.in_flight == 0
+
+
+@pytest.mark.curio
+async def test_in_flight_after_failures(app, client):
+    metrics(app)
+
+    @app.route('/crash')
+    async def crash(request):
+        raise ValueError('Unexpected.')
+
+    @app.route('/nothing')
+    async def nothing(request):
+        return None
+
+    async with client:
+        for path in ('/crash', '/nothing'):
+            with pytest.raises(Exception):
+                async with client.query('GET', path) as response:
+                    response.read()
+        async with client.query('GET', '/metrics') as response:
+            lines = response.read().decode().splitlines()
+
+    assert 'trinket_requests_in_flight 1' in lines
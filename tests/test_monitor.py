@@ -0,0 +1,67 @@
+import time
+import logging
+import pytest
+import curio
+from trinket import Response
+from trinket.extensions import metrics, monitor
+from trinket.monitor import LagMonitor
+
+
+pytestmark = pytest.mark.curio
+
+
+async def test_lag_is_measured():
+    lag = LagMonitor(0.01)
+    task = await curio.spawn(lag.run)
+    await curio.sleep(0.05)
+    assert lag.max < 0.05
+    # Holding the kernel.
+    time.sleep(0.1)
+    await curio.sleep(0.05)
+    await task.cancel()
+    assert lag.max >= 0.08
+    assert lag.samples > 3
+
+
+async def test_blocking_route_is_named(app, client, caplog):
+
+    @app.route('/block/{seconds}')
+    async def block(request, seconds):
+        time.sleep(float(seconds))
+        return Response.raw(b'Done.')
+
+    with caplog.at_level(logging.WARNING, logger='trinket.monitor'):
+        async with client:
+            async with client.query('GET', '/block/0.1') as response:
+                assert response.status == 200
+
+    blamed = [record.getMessage() for record in caplog.records
+              if record.name == 'trinket.monitor']
+    assert len(blamed) == 1
+    assert 'GET /block/{seconds} at ' in blamed[0]
+
+
+async def test_shutdown_before_startup(app):
+    monitor(app)
+    await app.notify('shutdown')
+
+
+async def test_lag_gauges(app, client):
+    metrics(monitor(app, interval=0.01))
+
+    @app.route('/block')
+    async def block(request):
+        time.sleep(0.1)
+        return Response.raw(b'Done.')
+
+    async with client:
+        async with client.query('GET', '/block') as response:
+            assert response.status == 200
+        await curio.sleep(0.05)
+        async with client.query('GET', '/metrics') as response:
+            lines = response.read().decode().splitlines()
+
+    gauges = dict(line.split() for line in lines
+                  if line.startswith('trinket_loop_lag'))
+    assert float(gauges['trinket_loop_lag_max_seconds']) >= 0.08
+    assert 'trinket_loop_lag_seconds' in gauges
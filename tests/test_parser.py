@@ -348,3 +348,89 @@ def test_request_get_unknown_cookie_key_raises_keyerror(parser):
         b'\r\n')
     with pytest.raises(KeyError):
         parser.request.cookies['foo']
+
+
+def test_bodyless_request_has_no_reader(parser):
+    parser.data_received(
+        b'GET /feeds HTTP/1.1\r\n'
+        b'Host: localhost:1707\r\n'
+        b'\r\n')
+    assert parser.complete is True
+    assert parser.reader is None
+    assert parser.request._reader is None
+
+
+def test_recycled_request():
+
+    class RecyclingChannel(Channel):
+        RECYCLE = True
+
+    parser = RecyclingChannel(None)
+    parser.data_received(
+        b'GET /feeds?foo=bar HTTP/1.1\r\n'
+        b'Host: localhost:1707\r\n'
+        b'Accept: */*\r\n'
+        b'\r\n')
+    request = parser.request
+    headers = request.headers
+    request['custom'] = 'value'
+    assert request.query['foo'] == ['bar']
+    parser.reset()
+
+    parser.data_received(
+        b'GET /other HTTP/1.1\r\n'
+        b'Host: localhost:1707\r\n'
+        b'\r\n')
+    assert parser.request is request
+    assert request.headers is headers
+    assert request.headers == {'Host': 'localhost:1707'}
+    assert request.path == '/other'
+    assert request.query == {}
+    assert 'custom' not in request
+
+
+def test_too_many_headers(parser):
+    headers = b''.join(b'X-Header-%i: value\r\n' % i for i in range(101))
+    with pytest.raises(HTTPError) as exc:
+        parser.data_received(
+            b'GET /feeds HTTP/1.1\r\n' + headers + b'\r\n')
+    assert exc.value.status == 431
+
+
+def test_header_value_too_long(parser):
+    with pytest.raises(HTTPError) as exc:
+        parser.data_received(
+            b'GET /feeds HTTP/1.1\r\n'
+            b'Cookie: ' + b'a' * 8193 + b'\r\n'
+            b'\r\n')
+    assert exc.value.status == 431
+
+
+def test_headers_too_large_before_parsing(parser):
+    parser.data_received(b'GET /feeds HTTP/1.1\r\nX-Big: ')
+    with pytest.raises(HTTPError) as exc:
+        for _ in range(64):
+            parser.data_received(b'a' * 1024)
+    assert exc.value.status == 431
+    assert parser.headers_complete is False
+
+
+def test_headers_too_large_raised_anew(parser):
+    errors = []
+    for _ in range(2):
+        parser.headers_size = 0
+        with pytest.raises(HTTPError) as exc:
+            parser.data_received(b'a' * (parser.MAX_HEADERS_SIZE + 1))
+        errors.append(exc.value)
+    assert errors[0] is not errors[1]
+    assert bytes(errors[0]) == bytes(HTTPError(
+        431, 'Request headers too large.'))
+
+
+def test_repeated_headers_are_joined(parser):
+    parser.data_received(
+        b'GET /feeds HTTP/1.1\r\n'
+        b'Accept: text/html\r\n'
+        b'Accept: */*\r\n'
+        b'\r\n')
+    assert parser.request.headers['Accept'] == 'text/html, */*'
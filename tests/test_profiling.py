@@ -0,0 +1,99 @@
+import time
+import pytest
+import curio
+from trinket import Response
+from trinket.extensions import profiler
+from trinket.profiling import RouteIndex, NO_ROUTE
+
+
+def test_route_index(app):
+
+    @app.route('/hello/{name}')
+    async def hello(request, name):
+        return Response.raw(b'Hello.')
+
+    @app.route('/sync', blocking=True)
+    def sync(request):
+        return Response.raw(b'Sync.')
+
+    index = RouteIndex(app.routes)
+    assert index.codes == {
+        hello.__code__: '/hello/{name}', sync.__code__: '/sync'}
+
+
+@pytest.mark.curio
+async def test_profile_by_route(app, client):
+    profiler(app)
+
+    @app.route('/busy')
+    async def busy(request):
+        # Holding the kernel: the sampler sees nothing else.
+        deadline = time.monotonic() + 0.2
+        while time.monotonic() < deadline:
+            sum(range(1000))
+        return Response.raw(b'Done.')
+
+    async def query(path):
+        async with client.query('GET', path) as response:
+            return response.status, await curio.run_in_thread(response.read)
+
+    async with client:
+        profile = await curio.spawn(query, '/_admin/profile?seconds=0.5')
+        await curio.sleep(0.05)
+        status, _ = await query('/busy')
+        assert status == 200
+        status, body = await profile.join()
+
+    assert status == 200
+    stacks = [line.rsplit(' ', 1) for line in body.decode().splitlines()]
+    routes = {stack.split(';', 1)[0] for stack, count in stacks}
+    assert '/busy' in routes
+    assert NO_ROUTE in routes
+    assert all(int(count) > 0 for stack, count in stacks)
+
+
+@pytest.mark.curio
+async def test_allocations_by_route(app, client):
+    profiler(app)
+    kept = []
+
+    @app.route('/leak')
+    async def leak(request):
+        kept.append(bytearray(100000))
+        return Response.raw(b'Leaked.')
+
+    async def query(path):
+        async with client.query('GET', path) as response:
+            return response.status, await curio.run_in_thread(response.read)
+
+    async with client:
+        report = await curio.spawn(query, '/_admin/allocations?seconds=0.3')
+        await curio.sleep(0.1)
+        for _ in range(3):
+            assert (await query('/leak'))[0] == 200
+        status, body = await report.join()
+
+    assert status == 200
+    first = body.decode().splitlines()[0].split()
+    assert int(first[0]) >= 300000
+    assert first[3] == '/leak'
+
+
+@pytest.mark.curio
+async def test_admin_only(app, client):
+    profiler(app, authorize=lambda request: False)
+
+    async with client:
+        async with client.query('GET', '/_admin/profile') as response:
+            assert response.status == 403
+
+
+@pytest.mark.curio
+async def test_interval_must_be_positive(app, client):
+    profiler(app)
+
+    async with client:
+        for interval in ('0', '-0.1'):
+            async with client.query(
+                    'GET', '/_admin/profile?interval=' + interval) as response:
+                assert response.status == 400
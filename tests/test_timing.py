@@ -0,0 +1,84 @@
+import logging
+import pytest
+import curio
+from trinket import Response
+from trinket.extensions import timing
+from trinket.timing import Timings
+
+
+def test_durations():
+    timings = Timings(10.0)
+    timings.headers = 10.001
+    timings.hooks = 10.002
+    timings.lookup = 10.0025
+    timings.handler = 10.0125
+    timings.response = 10.013
+    durations = timings.durations()
+    assert list(durations) == [
+        'read', 'request', 'lookup', 'handler', 'response']
+    assert durations['handler'] == pytest.approx(0.01)
+    assert timings.total == pytest.approx(0.013)
+    assert timings.header().startswith('read;dur=1.000, request;dur=1.000')
+
+
+@pytest.mark.curio
+async def test_server_timing_header(app, client):
+    timing(app)
+
+    @app.route('/slow')
+    async def slow(request):
+        await curio.sleep(0.02)
+        return Response.raw(b'Done.')
+
+    async with client:
+        async with client.query('GET', '/slow') as response:
+            header = response.getheader('Server-Timing')
+
+    phases = dict(item.split(';dur=') for item in header.split(', '))
+    assert list(phases) == [
+        'read', 'body', 'request', 'lookup', 'handler']
+    assert float(phases['handler']) >= 20
+
+
+@pytest.mark.curio
+async def test_no_timings_by_default(app, client):
+    timed = []
+
+    @app.route('/')
+    async def hello(request):
+        timed.append(request.timings)
+        return Response.raw(b'Hello.')
+
+    async with client:
+        async with client.query('GET', '/') as response:
+            assert response.getheader('Server-Timing') is None
+    assert timed == [None]
+
+
+@pytest.mark.curio
+async def test_slow_request_log(app, client, caplog):
+    timing(app, header=False, slow=0.01)
+
+    @app.route('/slow')
+    async def slow(request):
+        await curio.sleep(0.02)
+        return Response.raw(b'Done.')
+
+    @app.route('/fast')
+    async def fast(request):
+        return Response.raw(b'Done.')
+
+    with caplog.at_level(logging.WARNING, logger='trinket.slow'):
+        async with client:
+            async with client.query('GET', '/fast') as response:
+                assert response.getheader('Server-Timing') is None
+            async with client.query('GET', '/slow') as response:
+                assert response.status == 200
+            await curio.sleep(0.01)
+
+    messages = [record.getMessage() for record in caplog.records
+                if record.name == 'trinket.slow']
+    assert len(messages) == 1
+    assert messages[0].startswith('GET /slow took ')
+    assert 'handler;dur=' in messages[0]
+    assert 'write;dur=' in messages[0]
@@ -1,6 +1,16 @@
 import pytest
+import curio
 from http import HTTPStatus
-from wsproto.frame_protocol import CloseReason
+from wsproto import WSConnection, ConnectionType
+from wsproto.events import (
+    AcceptConnection, CloseConnection, Message, Request as WSRequest)
+from wsproto.extensions import PerMessageDeflate
+from wsproto.frame_protocol import CloseReason, FrameProtocol, Opcode, RsvBits
+from trinket import Response
+from trinket.extensions import keepalive
+from trinket.testing import Websocket as ClientWebsocket
+from trinket.websockets import (
+    Websocket, WebsocketClosedError, Topics, Deflate, frame)
 
 
 @pytest.mark.curio
@@ -38,6 +48,26 @@ async def test_websockets_store(app, client):
                 assert len(app.websockets) == 2
 
 
+@pytest.mark.curio
+async def test_websocket_closed_before_iterating(app, client):
+    finished = curio.Event()
+
+    @app.websocket('/late')
+    async def late(request, ws, **params):
+        await curio.sleep(0.2)
+        async for data in ws:
+            pass
+        assert await ws.recv() is None
+        await finished.set()
+
+    async with client:
+        async with client.websocket('/late'):
+            pass
+        await curio.timeout_after(2, finished.wait)
+        await curio.sleep(0.05)
+        assert len(app.websockets) == 0
+
+
 @pytest.mark.curio
 async def test_websocket_binary(app, client):
 
@@ -118,3 +148,562 @@ async def test_websocket_closure_from_within(app, client):
 
     assert ws.closure.code == CloseReason(1000)
     assert ws.closure.reason == 'Closed.'
+
+
+@pytest.mark.curio
+async def test_websocket_broadcast(app, client):
+
+    @app.websocket('/listen')
+    async def listen(request, ws, **params):
+        async for data in ws:
+            del data
+
+    @app.route('/shout')
+    async def shout(request):
+        closed = Websocket(None)
+        await closed.closing.set()
+        reached = await app.broadcast(
+            'Hello all.', targets=list(app.websockets) + [closed])
+        return Response.raw(str(reached))
+
+    async with client:
+        async with client.websocket('/listen') as ws1:
+            async with client.websocket('/listen') as ws2:
+                async with client.query('GET', '/shout') as response:
+                    assert response.read() == b'2'
+                assert await ws1.recv() == 'Hello all.'
+                assert await ws2.recv() == 'Hello all.'
+
+
+def test_frame_is_a_complete_server_message():
+    assert frame('Hi') == b'\x81\x02Hi'
+    assert frame(b'Hi') == b'\x82\x02Hi'
+
+
+def test_topics_index():
+    topics = Topics()
+    ws1, ws2 = object(), object()
+    topics.subscribe(ws1, 'news')
+    topics.subscribe(ws2, 'news')
+    topics.subscribe(ws1, 'sports')
+    assert topics.get('news') == {ws1, ws2}
+    assert topics.get('weather') == set()
+    assert 'weather' not in topics
+
+    topics.unsubscribe(ws2, 'news')
+    assert topics.get('news') == {ws1}
+    topics.discard(ws1)
+    assert len(topics) == 0
+    assert topics.subscriptions == {}
+
+
+@pytest.mark.curio
+async def test_websocket_publish(app, client):
+
+    @app.websocket('/room/{name}')
+    async def room(request, ws, name, **params):
+        app.topics.subscribe(ws, name)
+        while True:
+            data = await ws.recv()
+            if data is None:
+                break
+            await app.publish(name, data)
+
+    async with client:
+        async with client.websocket('/room/red') as red:
+            async with client.websocket('/room/blue') as blue:
+                await curio.sleep(0.01)
+                assert len(app.topics) == 2
+                await blue.send('To the blue room.')
+                assert await blue.recv() == 'To the blue room.'
+                await red.send('To the red room.')
+                assert await red.recv() == 'To the red room.'
+                assert blue.incoming.empty()
+
+        await curio.sleep(0.1)
+        assert len(app.topics) == 0
+
+
+class StalledSocket:
+    """A peer that never reads: nothing gets written, but for the close
+    frame of an abort."""
+    shut = False
+    sent = b''
+
+    async def sendall(self, data):
+        self.sent += data
+
+    async def shutdown(self, how):
+        self.shut = True
+
+
+class StuckSocket(StalledSocket):
+    """Its buffer is full."""
+
+    async def sendall(self, data):
+        await curio.sleep(10)
+
+
+def handshake(ws):
+    """The client side of an opened `ws`."""
+    peer = WSConnection(ConnectionType.CLIENT)
+    ws.protocol.receive_data(peer.send(WSRequest(host='bench', target='/')))
+    next(ws.protocol.events())
+    peer.receive_data(ws.protocol.send(AcceptConnection()))
+    next(peer.events())
+    return peer
+
+
+def stalled(policy, **attributes):
+    attributes.update(MAX_OUTGOING=2, OVERFLOW=policy)
+    return type('Stalled', (Websocket,), attributes)(StalledSocket())
+
+
+@pytest.mark.curio
+async def test_outgoing_drop_oldest():
+    ws = stalled(Websocket.DROP_OLDEST)
+    for message in ('one', 'two', 'three'):
+        await ws.send(message)
+    assert [event.data for event in ws.outgoing.items] == ['two', 'three']
+    assert ws.stats() == {'queued': 2, 'peak': 2, 'dropped': 1}
+
+
+@pytest.mark.curio
+async def test_outgoing_drop_newest():
+    ws = stalled(Websocket.DROP_NEWEST)
+    for message in ('one', 'two', 'three'):
+        await ws.send(message)
+    assert [event.data for event in ws.outgoing.items] == ['one', 'two']
+    assert ws.stats()['dropped'] == 1
+
+
+@pytest.mark.curio
+async def test_outgoing_block():
+    ws = stalled(Websocket.BLOCK)
+    await ws.send('one')
+    await ws.send('two')
+    with pytest.raises(curio.TaskTimeout):
+        await curio.timeout_after(0.05, ws.send('three'))
+    # Fan-outs don't wait.
+    await ws.send_frame(frame('three'))
+    assert ws.stats() == {'queued': 2, 'peak': 2, 'dropped': 1}
+    await ws.outgoing.get()
+    await ws.send('three')
+    assert len(ws.outgoing) == 2
+
+
+@pytest.mark.curio
+async def test_blocked_sender_woken_by_disconnection(app, client):
+
+    class BoundedWebsocket(Websocket):
+        MAX_OUTGOING = 2
+
+    errors = []
+
+    @app.websocket('/flood', factory=BoundedWebsocket)
+    async def flood(request, ws, **params):
+        try:
+            while True:
+                await ws.send('x' * 1000)
+        except WebsocketClosedError as exc:
+            errors.append(exc)
+
+    async with client:
+        ws = ClientWebsocket()
+        await ws.connect('/flood', *client.server.sockaddr)
+        await curio.sleep(0.05)
+        assert len(app.websockets) == 1
+        await ws.socket.close()
+        await curio.sleep(0.1)
+        assert len(errors) == 1
+        assert not app.websockets
+
+
+@pytest.mark.curio
+async def test_outgoing_disconnect():
+    ws = stalled(Websocket.DISCONNECT, OVERFLOW_GRACE=0.05)
+    peer = handshake(ws)
+    for message in ('one', 'two', 'three'):
+        await ws.send(message)
+    # Over the high-water mark, still within the grace period: bounded.
+    assert len(ws.outgoing) == 2
+    assert ws.stats()['dropped'] == 1
+    await curio.sleep(0.06)
+    with pytest.raises(WebsocketClosedError):
+        await ws.send('four')
+    assert ws.closed
+    assert ws.socket.shut
+    assert ws.closure.code == CloseReason(1008)
+    # The peer is told why.
+    peer.receive_data(ws.socket.sent)
+    closure = next(peer.events())
+    assert isinstance(closure, CloseConnection)
+    assert closure.code == CloseReason(1008)
+
+
+@pytest.mark.curio
+async def test_abort_stuck_socket():
+    ws = type('Stuck', (Websocket,), {'ABORT_TIMEOUT': 0.05})(StuckSocket())
+    handshake(ws)
+    await curio.timeout_after(1, ws.abort(1011, 'Ping timeout.'))
+    assert ws.closed
+    assert ws.socket.shut
+
+
+@pytest.mark.curio
+async def test_websocket_burst_is_received_in_one_batch(app, client):
+    batches = []
+
+    @app.websocket('/feed')
+    async def feed(request, ws, **params):
+        while True:
+            messages = await ws.recv_many()
+            if not messages:
+                break
+            batches.append(messages)
+            await ws.send(str(sum(map(len, batches))))
+
+    async with client:
+        async with client.websocket('/feed') as ws:
+            # Many small frames within a single write.
+            await ws.socket.sendall(b''.join(
+                ws.protocol.send(Message(data=str(i))) for i in range(50)))
+            while await ws.recv() != '50':
+                pass
+
+    assert [message for batch in batches for message in batch] == [
+        str(i) for i in range(50)]
+    assert len(batches) < 50
+
+
+@pytest.mark.curio
+async def test_closure_wakes_up_receivers():
+    ws = Websocket(None)
+    await ws.incoming.push('queued')
+
+    async def iterate():
+        return [message async for message in ws]
+
+    receiver = await curio.spawn(ws.recv)
+    iterator = await curio.spawn(iterate)
+    await curio.sleep(0)
+    await ws._set_closed()
+    assert await receiver.join() == 'queued'
+    assert await iterator.join() == []
+    assert await ws.recv() is None
+    assert await ws.recv_many() == []
+
+
+@pytest.mark.curio
+async def test_websocket_deflate(app, client):
+    negotiated = []
+
+    @app.websocket('/compressed', deflate={'min_size': 64})
+    async def compressed(request, ws, **params):
+        negotiated.extend(ws.protocol.connection._proto.extensions)
+        async for data in ws:
+            await ws.send(data)
+
+    text = 'All work and no play makes Jack a dull boy. ' * 100
+    async with client:
+        async with client.websocket(
+                '/compressed', extensions=[PerMessageDeflate()]) as ws:
+            await ws.send(text)
+            assert await ws.recv() == text
+            await ws.send('Short.')
+            assert await ws.recv() == 'Short.'
+
+    assert len(negotiated) == 1
+    assert isinstance(negotiated[0], Deflate)
+    assert negotiated[0].enabled()
+
+
+def test_deflate_skips_small_messages():
+    deflate = Deflate(min_size=64)
+    deflate.accept(PerMessageDeflate().offer())
+    proto = FrameProtocol(client=False, extensions=[deflate])
+    rsv = RsvBits(False, False, False)
+
+    text = b'All work and no play makes Jack a dull boy. ' * 100
+    rsv_out, data = deflate.frame_outbound(
+        proto, Opcode.TEXT, rsv, text, True)
+    assert rsv_out.rsv1
+    assert len(data) < len(text) // 10
+
+    rsv_out, data = deflate.frame_outbound(
+        proto, Opcode.TEXT, rsv, b'Short.', True)
+    assert not rsv_out.rsv1
+    assert data == b'Short.'
+
+
+@pytest.mark.curio
+async def test_websocket_deflate_not_offered(app, client):
+
+    @app.websocket('/compressed', deflate={})
+    async def compressed(request, ws, **params):
+        await ws.send('Uncompressed.')
+
+    async with client:
+        async with client.websocket('/compressed') as ws:
+            assert await ws.recv() == 'Uncompressed.'
+
+
+@pytest.mark.curio
+async def test_keepalive_evicts_stale_peers(app, client):
+    keepalive(app, interval=0.05, timeout=0.05)
+
+    @app.websocket('/quiet')
+    async def quiet(request, ws, **params):
+        await ws.closing.wait()
+
+    async with client:
+        # Connected, but never answering.
+        ws = ClientWebsocket()
+        await ws.connect('/quiet', *client.server.sockaddr)
+        assert len(app.websockets) == 1
+        ping = await ws.socket.recv(1024)
+        assert ping[0] == 0x89  # A single ping frame.
+        ws.protocol.receive_data(await ws.socket.recv(1024))
+        closure = next(ws.protocol.events())
+        assert closure.code == CloseReason(1011)
+        assert await ws.socket.recv(1024) == b''
+        await curio.sleep(0.01)
+        assert not app.websockets
+        await ws.socket.close()
+
+
+@pytest.mark.curio
+async def test_keepalive_shutdown_before_startup(app):
+    keepalive(app)
+    await app.notify('shutdown')
+
+
+@pytest.mark.curio
+async def test_keepalive_spares_live_peers(app, client):
+    keepalive(app, interval=0.05, timeout=0.05)
+
+    @app.websocket('/quiet')
+    async def quiet(request, ws, **params):
+        await ws.closing.wait()
+
+    async with client:
+        async with client.websocket('/quiet') as ws:
+            # Pongs are sent back by the client.
+            await curio.sleep(0.3)
+            assert not ws.closed
+            assert len(app.websockets) == 1
+
+
+@pytest.mark.curio
+async def test_keepalive_closes_idle_peers(app, client):
+    keepalive(app, interval=0.05, timeout=0.05, idle=0.2)
+
+    @app.websocket('/quiet')
+    async def quiet(request, ws, **params):
+        await ws.closing.wait()
+
+    async with client:
+        async with client.websocket('/quiet') as ws:
+            await ws.send('Still here.')
+            await curio.sleep(0.1)
+            assert not ws.closed
+            await curio.timeout_after(1, ws.closing.wait)
+            assert ws.closure.code == 1001
+
+
+async def send_fragments(ws, *fragments):
+    for fragment in fragments[:-1]:
+        await ws.outgoing.push(Message(data=fragment, message_finished=False))
+    await ws.outgoing.push(Message(data=fragments[-1]))
+
+
+@pytest.mark.curio
+async def test_websocket_fragments_are_reassembled(app, client):
+
+    @app.websocket('/echo')
+    async def echo(request, ws, **params):
+        async for data in ws:
+            await ws.send(data)
+
+    async with client:
+        async with client.websocket('/echo') as ws:
+            await send_fragments(ws, 'All work ', 'and no play ', 'is dull.')
+            assert await ws.recv() == 'All work and no play is dull.'
+            await send_fragments(ws, b'x' * 100000, b'y')
+            assert await ws.recv() == b'x' * 100000 + b'y'
+
+
+@pytest.mark.curio
+async def test_websocket_streaming(app, client):
+
+    class StreamingWebsocket(Websocket):
+        STREAMING = True
+
+    chunks = []
+
+    @app.websocket('/upload', factory=StreamingWebsocket)
+    async def upload(request, ws, **params):
+        async for message in ws:
+            size = 0
+            async for chunk in message:
+                size += len(chunk)
+                chunks.append(len(chunk))
+            await ws.send(f'{size} bytes')
+
+    async with client:
+        async with client.websocket('/upload') as ws:
+            await send_fragments(ws, *([b'x' * 65536] * 16))
+            assert await ws.recv() == '1048576 bytes'
+            await send_fragments(ws, b'Small.')
+            assert await ws.recv() == '6 bytes'
+
+    # Handed over as they came, never the whole message at once.
+    assert len(chunks) > 16
+    assert max(chunks) <= Websocket.MAX_READ
+
+
+@pytest.mark.curio
+async def test_websocket_skipped_stream(app, client):
+
+    class StreamingWebsocket(Websocket):
+        STREAMING = True
+        STREAM_BUFFER = 2
+
+    streams = []
+
+    @app.websocket('/skip', factory=StreamingWebsocket)
+    async def skip(request, ws, **params):
+        async for stream in ws:
+            streams.append(stream)
+            await ws.send(str(len(streams)))
+
+    async with client:
+        async with client.websocket('/skip') as ws:
+            await send_fragments(ws, *([b'x' * 10] * 8))
+            assert await ws.recv() == '1'
+            await send_fragments(ws, b'y')
+            assert await curio.timeout_after(1, ws.recv) == '2'
+        await curio.sleep(0.05)
+        assert not app.websockets
+
+    with pytest.raises(WebsocketClosedError):
+        async for chunk in streams[0]:
+            pass
+
+
+@pytest.mark.curio
+async def test_websocket_unread_stream_aborted(app, client):
+
+    class StreamingWebsocket(Websocket):
+        STREAMING = True
+        STREAM_BUFFER = 2
+
+    @app.websocket('/hold', factory=StreamingWebsocket)
+    async def hold(request, ws, **params):
+        # Holding the stream, never reading it.
+        assert await ws.recv() is not None
+        await ws.closing.wait()
+
+    async with client:
+        async with client.websocket('/hold') as ws:
+            await send_fragments(ws, *([b'x' * 10] * 8))
+            await curio.sleep(0.05)
+            server, = app.websockets
+            await server.abort(1011, 'Ping timeout.')
+            await curio.sleep(0.05)
+            assert not app.websockets
+
+
+@pytest.mark.curio
+async def test_websocket_message_too_big(app, client):
+
+    class BoundedWebsocket(Websocket):
+        MAX_MESSAGE = 1000
+
+    @app.websocket('/bounded', factory=BoundedWebsocket)
+    async def bounded(request, ws, **params):
+        async for data in ws:
+            await ws.send(data)
+
+    async with client:
+        async with client.websocket('/bounded') as ws:
+            await ws.send('x' * 1000)
+            assert await ws.recv() == 'x' * 1000
+            await send_fragments(ws, 'x' * 600, 'x' * 600)
+            await curio.timeout_after(1, ws.closing.wait)
+            assert ws.closure.code == 1009
+
+        async with client.websocket('/bounded') as ws:
+            # 600 characters, 1200 bytes.
+            await ws.send('é' * 600)
+            await curio.timeout_after(1, ws.closing.wait)
+            assert ws.closure.code == 1009
+
+
+@pytest.mark.curio
+async def test_websocket_message_limit_by_default(app, client):
+
+    @app.websocket('/echo')
+    async def echo(request, ws, **params):
+        async for data in ws:
+            await ws.send(str(len(data)))
+
+    async with client:
+        async with client.websocket('/echo') as ws:
+            await send_fragments(ws, *[b'x' * 65536] * 17)
+            await curio.timeout_after(2, ws.closing.wait)
+            assert ws.closure.code == 1009
+
+
+@pytest.mark.curio
+async def test_websocket_batching(app, client):
+    writes = []
+
+    class BatchingWebsocket(Websocket):
+        BATCH = True
+        BATCH_BYTES = 256
+
+    @app.websocket('/ticker', factory=BatchingWebsocket)
+    async def ticker(request, ws, **params):
+        await ws.recv()
+        for tick in range(100):
+            await ws.send(f'Tick {tick}.')
+        await ws.recv()
+        writes.append(ws.writes)
+
+    async with client:
+        async with client.websocket('/ticker') as ws:
+            await ws.send('Start.')
+            for tick in range(100):
+                assert await ws.recv() == f'Tick {tick}.'
+            await ws.send('Stop.')
+
+    # 100 frames of 10 bytes or so, within 256 bytes per write.
+    assert 3 < writes[0] <= 5
+
+
+@pytest.mark.curio
+async def test_websocket_batching_delay(app, client):
+    writes = []
+
+    class BatchingWebsocket(Websocket):
+        BATCH = True
+        BATCH_DELAY = 0.1
+
+    @app.websocket('/ticker', factory=BatchingWebsocket)
+    async def ticker(request, ws, **params):
+        await ws.recv()
+        for tick in range(10):
+            await ws.send(f'Tick {tick}.')
+            await curio.sleep(0.001)
+        await ws.recv()
+        writes.append(ws.writes)
+
+    async with client:
+        async with client.websocket('/ticker') as ws:
+            await ws.send('Start.')
+            for tick in range(10):
+                assert await ws.recv() == f'Tick {tick}.'
+            await ws.send('Stop.')
+
+    assert writes == [1]
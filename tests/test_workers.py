@@ -0,0 +1,152 @@
+import os
+import time
+import pickle
+import signal
+import pytest
+import curio
+from trinket import Request, Response, HTTPError
+from trinket.workers import ThreadPool, iterate
+
+
+pytestmark = pytest.mark.curio
+
+
+async def test_blocking_handler(client, app):
+
+    @app.route('/sync', blocking=True)
+    def sync(request):
+        time.sleep(0.01)
+        return Response.raw(b'Slept in a thread.')
+
+    async with client:
+        async with client.query('GET', '/sync') as response:
+            assert response.status == 200
+            assert response.read() == b'Slept in a thread.'
+
+    assert app.threads.calls == 1
+
+
+async def test_blocking_handler_can_read_the_body(client, app):
+
+    @app.route('/sync', methods=['POST'], blocking=True)
+    def sync(request):
+        return Response.raw(request.body)
+
+    async with client:
+        async with client.query('POST', '/sync', body=b'abc') as response:
+            assert response.read() == b'abc'
+
+
+async def test_blocking_stream(client, app):
+
+    def numbers():
+        for number in range(3):
+            time.sleep(0.01)
+            yield str(number).encode()
+
+    @app.route('/stream')
+    async def stream(request):
+        return Response.streamer(numbers(), blocking=True)
+
+    async with client:
+        async with client.query('GET', '/stream') as response:
+            # The chunks are produced while we read: don't block the kernel.
+            assert await curio.run_in_thread(response.read) == b'012'
+
+    assert app.threads.calls == 4
+
+
+async def test_pool_is_bounded_and_reports_queueing():
+    pool = ThreadPool(1)
+
+    async with curio.TaskGroup() as group:
+        for _ in range(3):
+            await group.spawn(pool.run, time.sleep, 0.05)
+
+    stats = pool.stats()
+    assert stats['calls'] == 3
+    assert stats['busy'] == 0
+    assert stats['waiting'] == 0
+    assert stats['wait_max'] >= 0.05
+    assert stats['wait_total'] >= stats['wait_max']
+
+
+async def test_iterate_without_pool():
+    collected = [chunk async for chunk in iterate([b'a', b'b'])]
+    assert collected == [b'a', b'b']
+
+
+def checksum(request, name):
+    # Module level: process pool handlers are pickled by reference.
+    total = sum(request.body) + int(request.query.get('salt'))
+    return Response.json({'name': name, 'sum': total})
+
+
+async def test_process_handler(client, app):
+    app.route('/sum/{name}', methods=['POST'], executor='process')(checksum)
+
+    async with client:
+        async with client.query(
+                'POST', '/sum/bytes?salt=1', body=b'\x01\x02') as response:
+            assert response.status == 200
+            assert response.read() == b'{"name": "bytes", "sum": 4}'
+
+
+async def test_unknown_executor(app):
+    with pytest.raises(ValueError):
+        app.route('/', executor='gpu')
+
+
+async def test_saturated_pool_raises_503():
+    pool = ThreadPool(1, backlog=1)
+
+    async with curio.TaskGroup() as group:
+        await group.spawn(pool.run, time.sleep, 0.05)
+        await group.spawn(pool.run, time.sleep, 0.05)
+        await curio.sleep(0)
+        with pytest.raises(HTTPError) as exc:
+            await pool.run(time.sleep, 0)
+
+    assert exc.value.status == 503
+    assert pool.stats()['rejected'] == 1
+
+
+async def test_pool_larger_than_curio_pools():
+    # curio's own thread pool stops at 64 threads.
+    pool = ThreadPool(80)
+    started = time.monotonic()
+    async with curio.TaskGroup() as group:
+        for _ in range(80):
+            await group.spawn(pool.run, time.sleep, 0.2)
+        await curio.sleep(0.1)
+        assert pool.stats()['busy'] == 80
+    assert time.monotonic() - started < 0.35
+    assert len(pool.workers.workers) == 80
+    pool.shutdown()
+    assert not pool.workers.workers
+
+
+async def test_pools_shut_down_with_the_server(app, client):
+
+    @app.route('/sync', blocking=True)
+    def sync(request):
+        return Response.raw(b'Slept in a thread.')
+
+    async with client:
+        async with client.query('GET', '/sync') as response:
+            assert response.status == 200
+        assert app.threads.workers.workers
+        os.kill(os.getpid(), signal.SIGTERM)
+        await curio.timeout_after(1, client.task.join)
+    assert not app.threads.workers.workers
+
+
+def test_request_pickles_detached():
+    request = Request(object(), object(), Host='localhost')
+    request.body = b'body'
+    request['custom'] = 'value'
+    copy = pickle.loads(pickle.dumps(request))
+    assert copy.socket is None
+    assert copy.body == b'body'
+    assert copy.headers == {'Host': 'localhost'}
+    assert copy['custom'] == 'value'